@@ -1,10 +1,101 @@
+from contextlib import contextmanager
+
+import numpy as np
+
+from Py.classes.compactGraph import CompactGraph
+from Py.classes.exitDistanceTree import ExitDistanceTree
+from Py.classes.pathCache import PathCache
+from Py.classes.rerouteCache import RerouteCache
+from Py.pathFinding.pathAlgorithms import edge_travel_times, waypoint_heuristic
+
+
 class Environment_info:
 
-    def __init__(self, graph, paths_connection, *,floors=None, floor_number=1, floor_connecting_nodes={}):
+    def __init__(self, graph, paths_connection, *,floors=None, floor_number=1, floor_connecting_nodes={}, path_cache=None, reroute_cache=None, waypoints=None,
+                 risk_timeline=None, normal_max_speed=1.0, stairs_max_speed=0.5):
 
         self.graph = graph
         self.floors = floors
         self.floor_number = floor_number
         self.floor_connecting_nodes = floor_connecting_nodes
-        self.floor_paths = {}
         self.paths_connection = paths_connection # database conection
+        self.path_cache = path_cache if path_cache is not None else PathCache() # in-memory LRU over the paths table and the candidate sets built from them
+        self.reroute_cache = reroute_cache if reroute_cache is not None else RerouteCache() # memoized reroute decisions
+        self.compact = CompactGraph(graph) # integer-indexed snapshot of the graph structure
+        self.node_index = self.compact.index # node -> position in the risk vectors
+        self.waypoints = waypoints # node -> ([x, y], radius), used for the A* heuristic
+        # precomputed RiskTimeline, used by the forecast-aware routing and as the per-frame risk source,
+        # with its columns in node_index order
+        self.risk_timeline = risk_timeline.reindex(self.node_index) if risk_timeline is not None else None
+        self.normal_max_speed = normal_max_speed
+        self.stairs_max_speed = stairs_max_speed
+        self._edge_times = None
+        self._risk_source = None
+        self._risk_vector = None
+        self._heuristics = {}
+        self._exit_distances = {}
+        self.posible_paths_batch = None # getPosiblePaths results shared inside path_batch()
+
+    def risk_vector(self, risk_per_node, frame=None):
+        """
+        Returns the risks of a frame as a dense vector ordered by node_index.
+
+        With a risk timeline and a frame the vector is the row of the timeline, read without copying.
+        Otherwise it is built from the mapping, and rebuilt only when a different mapping is passed,
+        so all the groups processed in the same frame share it. Nodes missing from the mapping keep
+        the risk stored in the graph.
+        """
+        if self.risk_timeline is not None and frame is not None:
+            return self.risk_timeline.risk_at(frame)
+        if risk_per_node is not self._risk_source:
+            self._risk_vector = np.array(
+                [risk_per_node.get(node, self.graph.nodes[node].get("risk", 0.0)) for node in self.node_index],
+                dtype=float,
+            )
+            self._risk_source = risk_per_node
+        return self._risk_vector
+
+    def exit_heuristic(self, targets):
+        """
+        Returns the A* heuristic towards the given targets, computed once per set of targets.
+        Without waypoints the heuristic is zero and the search falls back to Dijkstra.
+        """
+        key = frozenset(targets)
+        if key not in self._heuristics:
+            self._heuristics[key] = waypoint_heuristic(self.compact, self.waypoints, list(key))
+        return self._heuristics[key]
+
+    def exit_distances(self, targets, floor=None):
+        """
+        Returns the ExitDistanceTree towards the given targets, built once per floor and set of targets on the
+        same graph the paths of that floor are enumerated on (the whole graph without floors). Callers move it
+        between blocked sets with set_blocked, which only repairs the part of the tree that changes.
+        """
+        if self.floors is None:
+            floor = None
+        key = (floor, frozenset(targets))
+        if key not in self._exit_distances:
+            compact = self.compact if floor is None else CompactGraph(self.floors[floor])
+            self._exit_distances[key] = ExitDistanceTree(compact, list(key[1]))
+        return self._exit_distances[key]
+
+    def edge_times(self):
+        """
+        Returns the seconds needed to traverse each edge of the compact graph at the configured speeds.
+        """
+        if self._edge_times is None:
+            self._edge_times = edge_travel_times(self.compact, self.normal_max_speed, self.stairs_max_speed)
+        return self._edge_times
+
+    @contextmanager
+    def path_batch(self):
+        """
+        Shares the getPosiblePaths results between the groups rerouted inside the block, keyed by
+        node, algorithm and awareness. A group whose blocked nodes lie on the candidate paths gets
+        its own filtered result, the others reuse the shared one.
+        """
+        self.posible_paths_batch = {}
+        try:
+            yield self.posible_paths_batch
+        finally:
+            self.posible_paths_batch = None
@@ -9,13 +9,16 @@ class AgentGroup:
         algorithm (int): Identifier for the algorithm used:
                          0: shortest path
                          1: centrality measures
+                         2: risk-penalized shortest path (no path enumeration)
+                         3: risk-penalized shortest path against the forecast risks (EnvInf.risk_timeline)
         awareness_level (int): The awareness level of the agents:
                                0: Knows only upon reaching a neighboring node.
                                1: Knows every change as it happens.
         blocked_nodes (list): List of nodes that are currently blocked.
+        risk_weight (float): Cost charged per unit of risk by the risk-penalized shortest paths (algorithms 2 and 3).
     """
 
-    def __init__(self, agents, path, current_nodes, algorithm, awareness_level, *, blocked_nodes=None, wait_until_node=None, areInStairs=[]):
+    def __init__(self, agents, path, current_nodes, algorithm, awareness_level, *, blocked_nodes=None, wait_until_node=None, areInStairs=[], risk_weight=10.0):
         """
         Initializes an AgentGroup instance.
 
@@ -23,21 +26,24 @@ class AgentGroup:
             agents (list): List of agent IDs.
             path (list): The designated path for the group.
             current_nodes (dict): Dictionary mapping each agent's ID to its current node.
-            algorithm (int): Algorithm identifier (e.g., 0 for shortest path, 1 for centrality measures).
+            algorithm (int): Algorithm identifier (e.g., 0 for shortest path, 1 for centrality measures,
+                             2 for risk-penalized shortest path, 3 for its forecast-aware variant).
             awareness_level (int): The awareness level of the agents (e.g., 0 for low awareness or 1 for high awareness).
             blocked_nodes (list, optional): List of nodes to mark as blocked initially.
                                             Defaults to an empty list if not provided.
             wait_until_node (str, optional): Node identifier to wait at before executing certain operations.
                                              The related function will only execute once the agent reaches this node.
+            risk_weight (float, optional): Cost units charged per unit of node risk by algorithms 2 and 3.
         """
         self.agents = agents                          # List of agent IDs.
         self.path = path                              # Designated path for the group.
         self.current_nodes = current_nodes            # Dictionary mapping agent IDs to their current nodes.
-        self.algorithm = algorithm                    # Algorithm used (0 for shortest path, 1 for centrality measures).
+        self.algorithm = algorithm                    # Algorithm used (0 shortest path, 1 centrality measures, 2-3 risk-penalized).
         self.awareness_level = awareness_level        # Awareness level (0 or 1).
         self.blocked_nodes = blocked_nodes if blocked_nodes is not None else []
         self.wait_until_node = wait_until_node        # Node at which to continue looking for new paths
         self.areInStairs = areInStairs                # List of agents IDs that are in a stairs node
+        self.risk_weight = risk_weight                # Weight of the risk in the edge weights of algorithms 2 and 3
 
     def __repr__(self):
         """
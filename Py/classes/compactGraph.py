@@ -0,0 +1,118 @@
+import numpy as np
+from scipy import sparse
+
+
+class CompactGraph:
+    """
+    Read-only array snapshot of a directed graph for the hot loops of the simulation.
+
+    Node IDs are interned to contiguous ints in the order of G.nodes, and the successors and
+    predecessors of every node are stored in CSR form, so neighbours and edge costs are array
+    slices instead of dict lookups on string IDs. Only the structure and the static node
+    attributes are copied; the risk of the nodes is still read from the graph or the risk store.
+
+    Attributes:
+        ids (list): Node ID of each index.
+        index (dict): Mapping node ID -> index.
+        succ_ptr (np.ndarray): Successors of node i are succ_idx[succ_ptr[i]:succ_ptr[i + 1]].
+        succ_idx (np.ndarray): Successor indices, in the adjacency order of the graph.
+        succ_cost (np.ndarray): 'cost' of each successor edge.
+        pred_ptr (np.ndarray): Predecessors of node i are pred_idx[pred_ptr[i]:pred_ptr[i + 1]].
+        pred_idx (np.ndarray): Predecessor indices.
+        pred_cost (np.ndarray): 'cost' of each predecessor edge.
+        is_stairs (np.ndarray): Whether each node is a staircase.
+        floor (np.ndarray): Floor of each node (0 when the graph has no floors).
+    """
+
+    def __init__(self, G):
+        """
+        Builds the snapshot of a graph.
+
+        Parameters:
+            G (networkx.DiGraph): Graph with a 'cost' attribute on each edge and, optionally,
+                                  'is_stairs' and 'floor' attributes on each node.
+        """
+        self.ids = list(G.nodes)
+        self.index = {node: i for i, node in enumerate(self.ids)}
+        self.succ_ptr, self.succ_idx, self.succ_cost = self._csr(G.adj)
+        self.pred_ptr, self.pred_idx, self.pred_cost = self._csr(G.pred)
+        self.is_stairs = np.array([bool(G.nodes[node].get("is_stairs", False)) for node in self.ids], dtype=bool)
+        self.floor = np.array([G.nodes[node].get("floor", 0) for node in self.ids], dtype=np.int64)
+
+    def _csr(self, adjacency):
+        """
+        Returns the (ptr, idx, cost) CSR arrays of an adjacency mapping (G.adj or G.pred).
+        """
+        ptr = np.zeros(len(self.ids) + 1, dtype=np.int64)
+        idx = []
+        cost = []
+        for i, node in enumerate(self.ids):
+            for neighbor, data in adjacency[node].items():
+                idx.append(self.index[neighbor])
+                cost.append(data.get("cost", 1))
+            ptr[i + 1] = len(idx)
+        return ptr, np.array(idx, dtype=np.int64), np.array(cost, dtype=float)
+
+    @property
+    def number_of_nodes(self):
+        return len(self.ids)
+
+    @property
+    def number_of_edges(self):
+        return len(self.succ_idx)
+
+    def successors(self, i):
+        """
+        Returns the indices of the successors of node i and the costs of the edges to them.
+        """
+        start, end = self.succ_ptr[i], self.succ_ptr[i + 1]
+        return self.succ_idx[start:end], self.succ_cost[start:end]
+
+    def predecessors(self, i):
+        """
+        Returns the indices of the predecessors of node i and the costs of the edges from them.
+        """
+        start, end = self.pred_ptr[i], self.pred_ptr[i + 1]
+        return self.pred_idx[start:end], self.pred_cost[start:end]
+
+    def edge_cost(self, u, v):
+        """
+        Returns the cost of the edge between the indices u and v, or None if there is no such edge.
+        """
+        neighbors, costs = self.successors(u)
+        match = np.flatnonzero(neighbors == v)
+        return costs[match[0]] if len(match) else None
+
+    def to_indices(self, nodes):
+        """
+        Converts node IDs to an array of indices.
+        """
+        return np.array([self.index[node] for node in nodes], dtype=np.int64)
+
+    def to_ids(self, indices):
+        """
+        Converts indices back to a list of node IDs.
+        """
+        return [self.ids[i] for i in indices]
+
+    def node_values(self, values, default=0.0):
+        """
+        Returns a dense float vector of per-node values (e.g. risks) from a {node: value} mapping.
+        """
+        return np.array([values.get(node, default) for node in self.ids], dtype=float)
+
+    def cost_matrix(self):
+        """
+        Returns the edge costs as a scipy.sparse CSR matrix of shape (nodes, nodes).
+        """
+        n = len(self.ids)
+        return sparse.csr_matrix((self.succ_cost, self.succ_idx, self.succ_ptr), shape=(n, n))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        """
+        Returns a string representation of the CompactGraph instance, useful for debugging.
+        """
+        return f"CompactGraph(nodes={self.number_of_nodes}, edges={self.number_of_edges})"
@@ -0,0 +1,220 @@
+import heapq
+
+import numpy as np
+
+from Py.pathFinding.pathAlgorithms import COST_TOLERANCE
+
+
+class ExitDistanceTree:
+    """
+    Single-sink shortest-path tree towards a set of exits, maintained incrementally as nodes are
+    blocked and unblocked.
+
+    The distances are computed once with a reverse Dijkstra from the exits. Blocking nodes follows
+    the deletion phase of Ramalingam and Reps: only the nodes left without any tight successor in the
+    shortest-path DAG are affected, and only those are repaired with a Dijkstra seeded from their
+    unaffected successors. Unblocking nodes is a decrease-only Dijkstra from the reopened nodes over
+    the reverse graph. Afterwards distance_to_exit and next_hop are plain array lookups, and the tree
+    can be passed as the lower bound of collect_all_paths.
+
+    Attributes:
+        graph (CompactGraph): Snapshot of the graph the distances are computed on.
+        targets (list): Exit nodes.
+        dist (np.ndarray): Cost of the cheapest unblocked path from every node to an exit (inf if none).
+        next (np.ndarray): Successor index of every node on one of its cheapest paths (-1 if none).
+        blocked (np.ndarray): Whether each node is currently blocked.
+    """
+
+    def __init__(self, C, targets, blocked_nodes=None):
+        """
+        Builds the tree.
+
+        Parameters:
+            C (CompactGraph): Snapshot of the graph, e.g. Environment_info.compact.
+            targets (list): Exit nodes. Targets missing from the graph are ignored.
+            blocked_nodes (iterable, optional): Nodes blocked from the start.
+        """
+        self.graph = C
+        self.targets = [target for target in targets if target in C.index]
+        n = len(C.ids)
+        self.is_target = np.zeros(n, dtype=bool)
+        self.is_target[C.to_indices(self.targets)] = True
+        self.blocked = np.zeros(n, dtype=bool)
+        if blocked_nodes:
+            self.blocked[C.to_indices([node for node in set(blocked_nodes) if node in C.index])] = True
+        self.dist = np.full(n, np.inf)
+        self.next = np.full(n, -1, dtype=np.int64)
+
+        # Plain lists of (neighbour, cost) pairs, faster than slicing the CSR arrays in the Python loops
+        self._succ = [[(int(v), float(c)) for v, c in zip(*C.successors(i))] for i in range(n)]
+        self._pred = [[(int(u), float(c)) for u, c in zip(*C.predecessors(i))] for i in range(n)]
+
+        seeds = [int(i) for i in np.flatnonzero(self.is_target & ~self.blocked)]
+        self.dist[seeds] = 0.0
+        self._propagate([(0.0, i) for i in seeds])
+
+    def _propagate(self, heap, allowed=None):
+        """
+        Dijkstra over the reverse graph from the seeded (distance, node) entries, lowering the distances
+        of the unblocked predecessors (restricted to `allowed` when given).
+        """
+        heapq.heapify(heap)
+        dist, nxt, blocked = self.dist, self.next, self.blocked
+        while heap:
+            d, v = heapq.heappop(heap)
+            if d > dist[v]:
+                continue
+            for u, cost in self._pred[v]:
+                if blocked[u] or self.is_target[u] or (allowed is not None and u not in allowed):
+                    continue
+                candidate = d + cost
+                if candidate < dist[u] - COST_TOLERANCE:
+                    dist[u] = candidate
+                    nxt[u] = v
+                    heapq.heappush(heap, (candidate, u))
+
+    def _tight(self, u, v, cost):
+        return abs(self.dist[u] - (cost + self.dist[v])) <= COST_TOLERANCE
+
+    def block(self, nodes):
+        """
+        Blocks nodes and repairs the distances of the nodes whose cheapest paths went through them.
+        """
+        C = self.graph
+        new = [C.index[node] for node in set(nodes) if node in C.index and not self.blocked[C.index[node]]]
+        if not new:
+            return
+
+        # Find the affected nodes: those left without any tight successor outside the removed set
+        removed = set(new)
+        queue = list(new)
+        remaining = {}
+        while queue:
+            v = queue.pop()
+            for u, cost in self._pred[v]:
+                if u in removed or self.blocked[u] or self.is_target[u] or not np.isfinite(self.dist[u]):
+                    continue
+                if not self._tight(u, v, cost):
+                    continue
+                if u not in remaining:
+                    remaining[u] = sum(1 for w, c in self._succ[u] if not self.blocked[w] and self._tight(u, w, c))
+                remaining[u] -= 1
+                if remaining[u] == 0:
+                    removed.add(u)
+                    queue.append(u)
+
+        self.blocked[new] = True
+        for v in new:
+            self.dist[v] = np.inf
+            self.next[v] = -1
+
+        # Nodes that keep another tight successor just move their next hop
+        for u in remaining:
+            if u not in removed and self.next[u] in removed:
+                self.next[u] = next(w for w, c in self._succ[u]
+                                    if w not in removed and not self.blocked[w] and self._tight(u, w, c))
+
+        # Repair the affected nodes from their unaffected successors
+        affected = removed.difference(new)
+        heap = []
+        for u in affected:
+            self.dist[u] = np.inf
+            self.next[u] = -1
+        for u in affected:
+            for w, cost in self._succ[u]:
+                if w not in affected and not self.blocked[w] and cost + self.dist[w] < self.dist[u] - COST_TOLERANCE:
+                    self.dist[u] = cost + self.dist[w]
+                    self.next[u] = w
+            if np.isfinite(self.dist[u]):
+                heap.append((float(self.dist[u]), u))
+        self._propagate(heap, affected)
+
+    def unblock(self, nodes):
+        """
+        Unblocks nodes and lowers the distances of the nodes that can now reach an exit more cheaply.
+        """
+        C = self.graph
+        reopened = [C.index[node] for node in set(nodes) if node in C.index and self.blocked[C.index[node]]]
+        if not reopened:
+            return
+        self.blocked[reopened] = False
+        heap = []
+        for v in reopened:
+            if self.is_target[v]:
+                self.dist[v] = 0.0
+            else:
+                for w, cost in self._succ[v]:
+                    if not self.blocked[w] and cost + self.dist[w] < self.dist[v] - COST_TOLERANCE:
+                        self.dist[v] = cost + self.dist[w]
+                        self.next[v] = w
+            if np.isfinite(self.dist[v]):
+                heap.append((float(self.dist[v]), v))
+        self._propagate(heap)
+
+    def set_blocked(self, nodes):
+        """
+        Moves the tree to a new set of blocked nodes, blocking and unblocking only the difference.
+        """
+        C = self.graph
+        wanted = {node for node in nodes if node in C.index}
+        current = set(C.to_ids(np.flatnonzero(self.blocked)))
+        self.unblock(current - wanted)
+        self.block(wanted - current)
+
+    def distance_to_exit(self, node):
+        """
+        Returns the cost of the cheapest unblocked path from a node to an exit (inf if there is none).
+        """
+        return float(self.dist[self.graph.index[node]])
+
+    def next_hop(self, node):
+        """
+        Returns the successor of a node on one of its cheapest paths to an exit, or None for exits
+        and nodes that cannot reach one.
+        """
+        successor = self.next[self.graph.index[node]]
+        return None if successor < 0 else self.graph.ids[successor]
+
+    def reroute_needed(self, path, gamma):
+        """
+        Cheap check of whether a path (from the group's current node to an exit) should be replaced:
+        it traverses a blocked node, it no longer reaches an exit, or its cost exceeds (1 + gamma)
+        times the cheapest unblocked alternative.
+        """
+        C = self.graph
+        indices = C.to_indices(path)
+        if self.blocked[indices[1:]].any() or not self.is_target[indices[-1]]:
+            return True
+        cost = 0.0
+        for u, v in zip(indices, indices[1:]):
+            edge_cost = C.edge_cost(u, v)
+            if edge_cost is None:
+                return True
+            cost += edge_cost
+        return cost > (1 + gamma) * self.dist[indices[0]] + COST_TOLERANCE
+
+    def get(self, node, default=None):
+        """
+        Mapping-style access to the finite distances, so the tree can be used as the lower bound of
+        bounded_simple_paths and collect_all_paths.
+        """
+        i = self.graph.index.get(node)
+        if i is None or not np.isfinite(self.dist[i]):
+            return default
+        return float(self.dist[i])
+
+    def __getitem__(self, node):
+        distance = self.get(node)
+        if distance is None:
+            raise KeyError(node)
+        return distance
+
+    def __contains__(self, node):
+        return self.get(node) is not None
+
+    def __repr__(self):
+        """
+        Returns a string representation of the ExitDistanceTree instance, useful for debugging.
+        """
+        return (f"ExitDistanceTree(targets={self.targets}, blocked={int(self.blocked.sum())}, "
+                f"reachable={int(np.isfinite(self.dist).sum())})")
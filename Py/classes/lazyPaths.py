@@ -0,0 +1,67 @@
+class LazyPaths:
+    """
+    Read-only sequence over a lazily generated, ordered stream of paths.
+
+    The paths are produced on demand and remembered, so the sequence can be iterated several
+    times (as select_best_alternative_path does) while only the paths actually looked at are
+    built. len() and indexing past the consumed prefix pull the rest of the stream.
+
+    Attributes:
+        consumed (int): Number of paths produced so far.
+    """
+
+    def __init__(self, paths):
+        """
+        Initializes a LazyPaths sequence.
+
+        Parameters:
+            paths (iterable): The ordered paths, typically a generator.
+        """
+        self._paths = []
+        self._source = iter(paths)
+        self._exhausted = False
+
+    @property
+    def consumed(self):
+        return len(self._paths)
+
+    def _pull(self, count=None):
+        """
+        Produces paths until `count` are available (all of them if count is None).
+        """
+        while not self._exhausted and (count is None or len(self._paths) < count):
+            try:
+                self._paths.append(next(self._source))
+            except StopIteration:
+                self._exhausted = True
+
+    def __iter__(self):
+        i = 0
+        while True:
+            self._pull(i + 1)
+            if i >= len(self._paths):
+                return
+            yield self._paths[i]
+            i += 1
+
+    def __bool__(self):
+        self._pull(1)
+        return bool(self._paths)
+
+    def __len__(self):
+        self._pull()
+        return len(self._paths)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) or index < 0:
+            self._pull()
+        else:
+            self._pull(index + 1)
+        return self._paths[index]
+
+    def __repr__(self):
+        """
+        Returns a string representation of the LazyPaths instance, useful for debugging.
+        """
+        state = "exhausted" if self._exhausted else "pending"
+        return f"LazyPaths(consumed={len(self._paths)}, {state})"
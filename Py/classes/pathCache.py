@@ -0,0 +1,157 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+from Py.pathFinding.pathAlgorithms import graph_fingerprint
+
+
+class PathCache:
+    """
+    Bounded, thread-safe LRU cache of decoded candidate paths, layered over the paths table.
+
+    Entries are keyed by (graph fingerprint, source, target, gamma) and hold the list of
+    (path, cost, betweenness) tuples exactly as getAlternativePathsForNode consumes them,
+    so repeated lookups from the same node never touch the database or decode JSON again.
+    The structures built from those paths (the candidate PathSet of a node on a floor, the
+    detours around a set of blocked nodes) share the same LRU through get_entry and put_entry,
+    so maxsize bounds everything the routing keeps in memory.
+
+    Attributes:
+        maxsize (int): Maximum number of entries kept in memory.
+        hits (int): Number of lookups answered from memory.
+        misses (int): Number of lookups that had to go to the database or be enumerated.
+    """
+
+    def __init__(self, maxsize=4096):
+        """
+        Initializes an empty PathCache.
+
+        Parameters:
+            maxsize (int): Maximum number of entries before the least recently used one is evicted.
+        """
+        if maxsize <= 0:
+            raise ValueError("maxsize must be a positive integer.")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._fingerprints = weakref.WeakKeyDictionary()  # graph -> fingerprint, computed once per graph
+        self._lock = threading.Lock()
+
+    def fingerprint(self, G):
+        """
+        Returns the fingerprint of a graph, computing it only the first time the graph is seen.
+        """
+        with self._lock:
+            fingerprint = self._fingerprints.get(G)
+        if fingerprint is None:
+            fingerprint = graph_fingerprint(G)
+            with self._lock:
+                self._fingerprints[G] = fingerprint
+        return fingerprint
+
+    def get_many(self, G, source, targets, gamma):
+        """
+        Looks up the cached paths from a source to several targets.
+
+        Parameters:
+            G (networkx.DiGraph): Graph the paths were computed on.
+            source: The source node.
+            targets (list): The target nodes.
+            gamma (float): Cost tolerance the paths were enumerated with.
+
+        Returns:
+            tuple:
+                found (dict): {target: [(path, cost, betweenness), ...]} for the cached targets.
+                missing (list): Targets that are not in the cache.
+        """
+        fingerprint = self.fingerprint(G)
+        found = {}
+        missing = []
+        with self._lock:
+            for target in targets:
+                key = (fingerprint, source, target, gamma)
+                paths = self._entries.get(key)
+                if paths is None:
+                    self.misses += 1
+                    missing.append(target)
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    found[target] = paths
+        return found, missing
+
+    def put(self, G, source, target, gamma, paths):
+        """
+        Stores the paths from a source to a target, evicting the least recently used entries if needed.
+        """
+        key = (self.fingerprint(G), source, target, gamma)
+        with self._lock:
+            self._entries[key] = list(paths)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_entry(self, G, key):
+        """
+        Looks up a structure derived from the paths of a graph, e.g. ("candidates", floor, source, gamma).
+
+        Returns:
+            The cached value, or None if it is not in the cache.
+        """
+        key = (self.fingerprint(G), *key)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put_entry(self, G, key, value):
+        """
+        Stores a structure derived from the paths of a graph, evicting the least recently used entries if needed.
+        """
+        key = (self.fingerprint(G), *key)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes every entry and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: {'hits', 'misses', 'hit_rate', 'size', 'maxsize'}
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __repr__(self):
+        """
+        Returns a string representation of the PathCache instance, useful for debugging.
+        """
+        return f"PathCache(size={len(self)}, maxsize={self.maxsize}, hits={self.hits}, misses={self.misses})"
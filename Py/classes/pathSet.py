@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class PathSet:
+    """
+    Candidate paths of a node together with a path × node incidence index.
+
+    Nodes are interned to contiguous column indices and each path is a row of a boolean
+    incidence matrix, so filtering by a blocked set is a single vectorized `any` over the
+    blocked columns instead of a membership scan per path.
+
+    Attributes:
+        paths (list): Tuples (path, cost, centrality_value) in their original order.
+        costs (np.ndarray): Cost of each path.
+        node_index (dict): Mapping node -> column of the incidence matrix.
+        incidence (np.ndarray): Boolean matrix of shape (len(paths), len(node_index)).
+    """
+
+    def __init__(self, paths):
+        """
+        Builds the incidence index of the given paths.
+
+        Parameters:
+            paths (iterable): Tuples (path, cost, centrality_value), where `path` is a list of nodes.
+        """
+        self.paths = list(paths)
+        self.costs = np.array([cost for _, cost, _ in self.paths], dtype=float)
+        self.node_index = {}
+        rows = []
+        columns = []
+        for row, (path, _, _) in enumerate(self.paths):
+            for node in path:
+                rows.append(row)
+                columns.append(self.node_index.setdefault(node, len(self.node_index)))
+        self.incidence = np.zeros((len(self.paths), len(self.node_index)), dtype=bool)
+        self.incidence[rows, columns] = True
+
+    def unblocked_mask(self, blocked_nodes):
+        """
+        Returns a boolean mask selecting the paths that do not traverse any blocked node.
+
+        Parameters:
+            blocked_nodes (iterable): Nodes that are blocked. Nodes not in any path are ignored.
+        """
+        columns = [self.node_index[node] for node in set(blocked_nodes or ()) if node in self.node_index]
+        if not columns:
+            return np.ones(len(self.paths), dtype=bool)
+        return ~self.incidence[:, columns].any(axis=1)
+
+    def select(self, mask):
+        """
+        Returns the (path, cost, centrality_value) tuples selected by a boolean mask, in order.
+        """
+        return [self.paths[i] for i in np.flatnonzero(mask)]
+
+    def unblocked(self, blocked_nodes):
+        """
+        Returns the paths that do not contain any of the blocked nodes.
+        """
+        return self.select(self.unblocked_mask(blocked_nodes))
+
+    def efficient(self, gamma, mask=None):
+        """
+        Returns the paths, among those selected by `mask`, whose cost is within (1 + gamma) times
+        the cheapest selected path, as compute_efficient_paths does.
+        """
+        if mask is None:
+            mask = np.ones(len(self.paths), dtype=bool)
+        min_cost = min(self.costs[mask])
+        max_allowed_cost = (1 + gamma) * min_cost
+        return self.select(mask & (self.costs <= max_allowed_cost))
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __getitem__(self, index):
+        return self.paths[index]
+
+    def __repr__(self):
+        """
+        Returns a string representation of the PathSet instance, useful for debugging.
+        """
+        return f"PathSet(paths={len(self.paths)}, nodes={len(self.node_index)})"
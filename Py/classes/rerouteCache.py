@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+
+
+class RerouteCache:
+    """
+    Bounded, thread-safe LRU cache of reroute decisions.
+
+    Between two risk updates compute_alternative_path is called again and again with the same
+    inputs, so its decisions are memoized under a key built from everything the decision reads:
+    (current_node, next_node, awareness, algorithm, frozenset(blocked_nodes), risk signature, ...).
+    Each entry holds the chosen path and the nodes the decision appended to the group's
+    blocked_nodes, so a hit can replay the decision without recomputing it.
+
+    Attributes:
+        maxsize (int): Maximum number of decisions kept in memory.
+        hits (int): Number of decisions answered from memory.
+        misses (int): Number of decisions that had to be computed.
+    """
+
+    def __init__(self, maxsize=4096):
+        """
+        Initializes an empty RerouteCache.
+
+        Parameters:
+            maxsize (int): Maximum number of entries before the least recently used one is evicted.
+        """
+        if maxsize <= 0:
+            raise ValueError("maxsize must be a positive integer.")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Looks up a decision.
+
+        Returns:
+            tuple or None: (best_path, added_blocked_nodes) if the decision is cached, None otherwise.
+        """
+        with self._lock:
+            decision = self._entries.get(key)
+            if decision is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return decision
+
+    def put(self, key, best_path, added_blocked_nodes):
+        """
+        Stores a decision, evicting the least recently used entries if needed.
+        """
+        decision = (None if best_path is None else tuple(best_path), tuple(added_blocked_nodes))
+        with self._lock:
+            self._entries[key] = decision
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes every entry and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: {'hits', 'misses', 'hit_rate', 'size', 'maxsize'}
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __repr__(self):
+        """
+        Returns a string representation of the RerouteCache instance, useful for debugging.
+        """
+        return f"RerouteCache(size={len(self)}, maxsize={self.maxsize}, hits={self.hits}, misses={self.misses})"
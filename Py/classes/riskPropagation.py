@@ -0,0 +1,183 @@
+import random
+
+import numpy as np
+from scipy import sparse
+
+from Py.classes.compactGraph import CompactGraph
+
+
+def round_risks(values):
+    """
+    Rounds risks to one decimal exactly like the built-in round(value, 1).
+
+    np.round scales by 10 before rounding, which can break ties differently from the built-in
+    (e.g. 0.35 is stored as 0.34999..., so round gives 0.3 but np.round gives 0.4); the few values
+    lying that close to a tie are rounded with the built-in instead.
+    """
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, 1)
+    scaled = values * 10
+    for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6):
+        rounded.flat[i] = round(float(values.flat[i]), 1)
+    return rounded
+
+
+def _gather(ptr, idx, rows):
+    """
+    Returns the concatenated CSR rows of the given row indices, and the row each entry comes from.
+    """
+    starts = ptr[rows]
+    counts = ptr[rows + 1] - starts
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+    return idx[offsets], np.repeat(rows, counts)
+
+
+class RiskPropagation:
+    """
+    Array-backed engine for the risk updates of update_risk.
+
+    The undirected adjacency of the graph and the exclusive 2-hop neighbourhoods (nodes at distance
+    exactly two) are precomputed in CSR form once, and the risks are held in a float vector ordered
+    like G.nodes, so an update is a handful of vectorized operations instead of graph traversals and
+    node attribute lookups. The random increments draw from the `random` module in the same order as
+    before, so seeded runs give the same risks.
+
+    Attributes:
+        ids (list): Node ID of each index, in the order of G.nodes.
+        index (dict): Mapping node ID -> index.
+        adj_ptr (np.ndarray): Undirected neighbours of node i are adj_idx[adj_ptr[i]:adj_ptr[i + 1]].
+        adj_idx (np.ndarray): Undirected neighbour indices.
+        two_hop_ptr (np.ndarray): Nodes at distance two of node i are two_hop_idx[two_hop_ptr[i]:two_hop_ptr[i + 1]].
+        two_hop_idx (np.ndarray): Indices of the nodes at distance two.
+        number_of_edges (int): Number of edges of the graph the engine was built from.
+        risks (np.ndarray): Current risk of every node.
+    """
+
+    def __init__(self, G):
+        """
+        Builds the engine of a graph and loads its current risks.
+
+        Parameters:
+            G (networkx.DiGraph): Graph with a 'risk' attribute on each node (0.0 if missing).
+        """
+        C = CompactGraph(G)
+        self.ids = C.ids
+        self.index = C.index
+        n = len(self.ids)
+
+        directed = sparse.csr_matrix((np.ones(len(C.succ_idx), dtype=np.int64), C.succ_idx, C.succ_ptr), shape=(n, n))
+        adjacency = ((directed + directed.T) > 0).astype(np.int64).tocsr()
+        adjacency.sort_indices()
+        # Nodes reachable in two steps that are neither the node itself nor one of its neighbours
+        reach = ((adjacency @ adjacency) > 0).astype(np.int64)
+        two_hop = ((reach - adjacency - sparse.identity(n, dtype=np.int64, format="csr")) > 0).tocsr()
+        two_hop.sort_indices()
+
+        self.adj_ptr, self.adj_idx = adjacency.indptr.astype(np.int64), adjacency.indices.astype(np.int64)
+        self.two_hop_ptr, self.two_hop_idx = two_hop.indptr.astype(np.int64), two_hop.indices.astype(np.int64)
+        self.number_of_edges = G.number_of_edges()
+        self.risks = np.zeros(n)
+        self.load(G)
+
+    def load(self, G):
+        """
+        Reads the risks from the 'risk' attribute of the graph nodes.
+        """
+        self.risks = np.array([G.nodes[node].get("risk", 0.0) for node in self.ids], dtype=float)
+
+    def store(self, G):
+        """
+        Writes the risks back to the 'risk' attribute of the graph nodes.
+        """
+        for node, risk in zip(self.ids, self.risks.tolist()):
+            G.nodes[node]["risk"] = risk
+
+    def set_risk(self, node, risk):
+        """
+        Sets the risk of a node, ignoring nodes that are not in the graph.
+        """
+        i = self.index.get(node)
+        if i is not None:
+            self.risks[i] = risk
+
+    def risks_by_node(self):
+        """
+        Returns the current risks as a {node: risk} dict.
+        """
+        return dict(zip(self.ids, self.risks.tolist()))
+
+    def update(self, increase_chance=0.2, danger_threshold=0.5, rng=random):
+        """
+        Performs one risk update, as described in update_risk.
+
+        Parameters:
+            increase_chance (float): Chance to increase the base risk of each node.
+            danger_threshold (float): Threshold above which a node is considered dangerous.
+            rng: Source of the random draws (the `random` module by default), with random() and uniform().
+        """
+        old = self.risks
+        new = old.copy()
+
+        # Random increments of the nodes with a positive risk. The draws depend on each other (a uniform
+        # is only drawn after a successful random()), so they are taken in node order as before.
+        draw, uniform = rng.random, rng.uniform
+        for i in np.flatnonzero(old > 0).tolist():
+            if draw() < increase_chance:
+                new[i] = min(1.0, new[i] + uniform(0.05, 0.2))
+        new = round_risks(new)
+
+        # Deterministic propagation from the dangerous nodes: a third of their risk to the direct
+        # neighbours and a ninth to the nodes at distance two
+        dangerous = np.flatnonzero(old >= danger_threshold)
+        if len(dangerous):
+            for ptr, idx, share in ((self.adj_ptr, self.adj_idx, 3), (self.two_hop_ptr, self.two_hop_idx, 9)):
+                targets, sources = _gather(ptr, idx, dangerous)
+                np.maximum.at(new, targets, round_risks(old[sources] / share))
+
+        self.risks = new
+
+    def update_batch(self, risks, increase_chance, danger_threshold, rngs):
+        """
+        Performs one risk update of several independent realisations at once.
+
+        Each realisation draws its increments from its own numpy Generator, one random number and
+        one uniform increment per node on every update whatever its risks, so a realisation does
+        not depend on the others in the batch. The streams differ from those of `update` (the
+        `random` module), so batched and serial runs with the same seed are not comparable.
+
+        Parameters:
+            risks (np.ndarray): Risks of shape (realisations, nodes).
+            increase_chance (float): Chance to increase the base risk of each node.
+            danger_threshold (float): Threshold above which a node is considered dangerous.
+            rngs (list of np.random.Generator): One generator per realisation.
+
+        Returns:
+            np.ndarray: The updated risks, of the same shape.
+        """
+        n = len(self.ids)
+        draws = np.stack([rng.random(n) for rng in rngs])
+        increments = np.stack([rng.uniform(0.05, 0.2, n) for rng in rngs])
+        increase = (risks > 0) & (draws < increase_chance)
+        new = round_risks(np.where(increase, np.minimum(1.0, risks + increments), risks))
+
+        # Every target takes the max share of its dangerous neighbours: the adjacency and the 2-hop
+        # relation are symmetric, so the sources of node t are the CSR row t
+        dangerous = risks >= danger_threshold
+        if dangerous.any():
+            for ptr, idx, share in ((self.adj_ptr, self.adj_idx, 3), (self.two_hop_ptr, self.two_hop_idx, 9)):
+                rows = np.flatnonzero(np.diff(ptr))
+                if not len(rows):
+                    continue
+                shares = np.where(dangerous, round_risks(risks / share), -np.inf)
+                received = np.maximum.reduceat(shares[:, idx], ptr[rows], axis=1)
+                new[:, rows] = np.maximum(new[:, rows], received)
+        return new
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        """
+        Returns a string representation of the RiskPropagation instance, useful for debugging.
+        """
+        return f"RiskPropagation(nodes={len(self.ids)}, max_risk={float(self.risks.max(initial=0.0))})"
@@ -0,0 +1,204 @@
+import json
+from collections.abc import Mapping
+
+import numpy as np
+
+from Py.database.danger_sim_db_manager import fetch_risk_changes, fetch_risk_frames
+
+
+class FrameRisks(Mapping):
+    """
+    Read-only {area: risk} view of one row of a RiskTimeline, usable wherever the dict returned by
+    get_risk_levels_by_frame is expected.
+
+    Values are converted to float on access and rounded to 6 decimals, so risks stored as float32
+    read back as the values that were written (e.g. 0.3 rather than 0.30000001192092896).
+    """
+
+    def __init__(self, row, node_index):
+        """
+        Parameters:
+            row (np.ndarray): Risk of every node, ordered by node_index.
+            node_index (dict): Mapping node -> position in the row.
+        """
+        self._row = row
+        self._node_index = node_index
+        self._values = None
+
+    def _value(self, column):
+        if self._values is None:
+            self._values = np.round(np.asarray(self._row, dtype=float), 6).tolist()
+        return self._values[column]
+
+    def __getitem__(self, area):
+        return self._value(self._node_index[area])
+
+    def get(self, area, default=None):
+        column = self._node_index.get(area)
+        return default if column is None else self._value(column)
+
+    def __contains__(self, area):
+        return area in self._node_index
+
+    def __iter__(self):
+        return iter(self._node_index)
+
+    def __len__(self):
+        return len(self._node_index)
+
+    def __repr__(self):
+        """
+        Returns a string representation of the FrameRisks instance, useful for debugging.
+        """
+        return f"FrameRisks(nodes={len(self._node_index)})"
+
+
+class RiskTimeline:
+    """
+    The precomputed risk series of a simulation as a dense frames × nodes array.
+
+    simulate_risk only stores every nth frame, so the risk of any frame is the one of the latest
+    stored frame at or before it. Nodes missing from a stored frame keep their previous risk
+    (0.0 before they first appear).
+
+    The timeline can be saved as a float32 .npy file (plus a .json file with the frames and nodes)
+    and loaded back memory-mapped, so the processes simulating the same scenario share its pages
+    instead of each querying the risk database.
+
+    Attributes:
+        frames (np.ndarray): Stored frame numbers, in increasing order.
+        risks (np.ndarray): Array of shape (len(frames), len(node_index)) with the risk of every node
+                            (possibly a read-only np.memmap).
+        node_index (dict): Mapping node -> column of the risks array.
+        seconds_per_frame (float): Simulated seconds between two consecutive frames, used to
+                                   convert travel times into frames.
+    """
+
+    def __init__(self, frames, risks, node_index, seconds_per_frame=1.0):
+        """
+        Initializes a RiskTimeline.
+
+        Parameters:
+            frames (array-like): Stored frame numbers, in increasing order.
+            risks (array-like): Risks of shape (len(frames), len(node_index)). Floating arrays, e.g. a
+                                float32 memmap, are used as they are.
+            node_index (dict): Mapping node -> column of the risks array.
+            seconds_per_frame (float): Simulated seconds per frame, e.g.
+                                       simulation.delta_time() * every_nth_frame_simulation.
+        """
+        if seconds_per_frame <= 0:
+            raise ValueError("seconds_per_frame must be positive.")
+        self.frames = np.asarray(frames, dtype=np.int64)
+        self.risks = np.asarray(risks)
+        if not np.issubdtype(self.risks.dtype, np.floating):
+            self.risks = self.risks.astype(float)
+        if self.risks.shape != (len(self.frames), len(node_index)):
+            raise ValueError("risks must have shape (frames, nodes).")
+        self.node_index = node_index
+        self.seconds_per_frame = seconds_per_frame
+        # Row in effect at every integer frame up to the last stored one, so row() is a lookup
+        last = int(self.frames[-1]) if len(self.frames) else 0
+        self._row_of = np.maximum(np.searchsorted(self.frames, np.arange(max(last, 0) + 1), side="right") - 1, 0)
+        self._stored_rows = {frame: i for i, frame in enumerate(self.frames.tolist())}
+
+    @classmethod
+    def from_connection(cls, connection, node_index, *, seconds_per_frame=1.0):
+        """
+        Loads the whole risk_data table once into a RiskTimeline. Delta-stored tables are read as they are
+        stored, the forward fill rebuilding the frames between the changes.
+
+        Parameters:
+            connection (sqlite3.Connection): Connection to the risk database.
+            node_index (dict): Mapping node -> column, e.g. Environment_info.node_index.
+            seconds_per_frame (float): Simulated seconds per frame.
+        """
+        rows = fetch_risk_changes(connection)
+        frames = fetch_risk_frames(connection)
+        frame_row = {frame: i for i, frame in enumerate(frames)}
+        risks = np.full((len(frames), len(node_index)), np.nan)
+        for frame, area, risk in rows:
+            column = node_index.get(area)
+            if column is not None:
+                risks[frame_row[frame], column] = risk
+        # Carry the last known risk of each node forward over the frames where it was not stored
+        for i in range(len(frames)):
+            missing = np.isnan(risks[i])
+            risks[i, missing] = risks[i - 1, missing] if i > 0 else 0.0
+        return cls(frames, risks, node_index, seconds_per_frame)
+
+    @classmethod
+    def load(cls, path, *, mmap=True):
+        """
+        Loads a timeline written by save.
+
+        Parameters:
+            path (str or Path): Path of the files without extension.
+            mmap (bool): Whether to memory-map the risks instead of reading them into memory.
+        """
+        with open(f"{path}.json") as f:
+            metadata = json.load(f)
+        risks = np.load(f"{path}.npy", mmap_mode="r" if mmap else None)
+        node_index = {node: i for i, node in enumerate(metadata["nodes"])}
+        return cls(metadata["frames"], risks, node_index, metadata["seconds_per_frame"])
+
+    def save(self, path):
+        """
+        Writes the risks as a float32 {path}.npy file and the frames, nodes (in column order) and
+        seconds_per_frame as {path}.json.
+        """
+        np.save(f"{path}.npy", np.asarray(self.risks, dtype=np.float32))
+        nodes = sorted(self.node_index, key=self.node_index.get)
+        with open(f"{path}.json", "w") as f:
+            json.dump({"frames": self.frames.tolist(), "nodes": nodes, "seconds_per_frame": self.seconds_per_frame}, f)
+
+    def reindex(self, node_index):
+        """
+        Returns the timeline with its columns ordered by another node_index, e.g. Environment_info.node_index.
+
+        The columns are remapped once, so the risk vectors can then be indexed by the positions of that
+        index. Returns the timeline itself when it already uses the same order, and nodes it does not
+        know get a risk of 0.0.
+        """
+        if node_index is self.node_index or node_index == self.node_index:
+            return self if node_index is self.node_index else RiskTimeline(self.frames, self.risks, node_index, self.seconds_per_frame)
+        risks = np.zeros((len(self.frames), len(node_index)), dtype=self.risks.dtype)
+        columns = [(column, self.node_index[node]) for node, column in node_index.items() if node in self.node_index]
+        if columns:
+            new_columns, old_columns = zip(*columns)
+            risks[:, list(new_columns)] = self.risks[:, list(old_columns)]
+        return RiskTimeline(self.frames, risks, node_index, self.seconds_per_frame)
+
+    def row(self, frame):
+        """
+        Returns the row of the risks array in effect at a (possibly fractional) frame.
+        """
+        if frame < 0:
+            return 0
+        if frame >= len(self._row_of):
+            return len(self.frames) - 1 if len(self.frames) else 0
+        return int(self._row_of[int(frame)])
+
+    def risk_at(self, frame):
+        """
+        Returns the risk vector of every node at a frame (a view, not a copy).
+        """
+        return self.risks[self.row(frame)]
+
+    def risk_levels(self, frame):
+        """
+        Returns the {area: risk} mapping of a frame like get_risk_levels_by_frame does: the risks of
+        the frame if it was stored, an empty dict otherwise.
+        """
+        row = self._stored_rows.get(frame)
+        if row is None:
+            return {}
+        return FrameRisks(self.risks[row], self.node_index)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __repr__(self):
+        """
+        Returns a string representation of the RiskTimeline instance, useful for debugging.
+        """
+        return f"RiskTimeline(frames={len(self.frames)}, nodes={len(self.node_index)}, seconds_per_frame={self.seconds_per_frame})"
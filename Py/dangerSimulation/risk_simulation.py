@@ -1,8 +1,14 @@
 import networkx as nx
+import numpy as np
 import random
+import weakref
 
+from Py.classes.riskPropagation import RiskPropagation
 from Py.database.danger_sim_db_manager import *
 
+# Risk engine of each graph, built the first time update_risk is called on it
+_risk_engines = weakref.WeakKeyDictionary()
+
 def update_risk(G: nx.DiGraph, increase_chance=0.2, danger_threshold=0.5):
     """
     Updates the risk levels of nodes in the graph.
@@ -12,49 +18,23 @@ def update_risk(G: nx.DiGraph, increase_chance=0.2, danger_threshold=0.5):
       - The neighbors of these (excluding the original node and its direct neighbors) receive a risk increase of one-ninth of its risk.
       - Nodes with a risk of 0 will not have their risk increased randomly unless affected by propagation from dangerous nodes.
 
+    The update runs on the RiskPropagation engine of the graph, built once per graph (and rebuilt
+    if its number of nodes or edges changes).
+
     Args:
         G (nx.DiGraph): Graph with nodes and edges.
         increase_chance (float): Chance to increase the base risk of each node.
         danger_threshold (float): Threshold above which a node is considered dangerous.
     """
-    new_risks = {}
-
-    # Randomly update the risk for each node,
-    # except for nodes with risk 0 (unless they are affected by dangerous node propagation)
-    for node in G.nodes:
-        current_risk = G.nodes[node]["risk"]
-        if current_risk > 0 and random.random() < increase_chance:
-            current_risk = min(1.0, current_risk + random.uniform(0.05, 0.2))
-        new_risks[node] = round(current_risk, 1)
-
-    # Convert the graph to an undirected version for symmetric propagation.
-    UG = G.to_undirected()
-
-    # Deterministic propagation from dangerous nodes symmetrically.
-    for node in G.nodes:
-        node_risk = G.nodes[node]["risk"]
-        if node_risk >= danger_threshold:
-            # First level: direct neighbors (in undirected sense) receive one-third of the node's risk.
-            risk_direct = round(node_risk / 3, 1)
-            for neighbor in UG.neighbors(node):
-                new_risks[neighbor] = max(new_risks.get(neighbor, G.nodes[neighbor]["risk"]), risk_direct)
-            # Second level: neighbors of direct neighbors
-            # Exclude the original node and its direct neighbors to avoid overlaps.
-            first_level = set(UG.neighbors(node))
-            for neighbor in first_level:
-                for second_neighbor in UG.neighbors(neighbor):
-                    if second_neighbor == node or second_neighbor in first_level:
-                        continue
-                    risk_second = round(node_risk / 9, 1)
-                    new_risks[second_neighbor] = max(
-                        new_risks.get(second_neighbor, G.nodes[second_neighbor]["risk"]), risk_second
-                    )
-
-    # Apply the new risk values to the graph.
-    for node, risk in new_risks.items():
-        G.nodes[node]["risk"] = risk
-
-def simulate_risk(risk_sim_values, every_nth_frame, G, exits, connection, seed=None):
+    engine = _risk_engines.get(G)
+    if engine is None or len(engine) != G.number_of_nodes() or engine.number_of_edges != G.number_of_edges():
+        engine = _risk_engines[G] = RiskPropagation(G)
+    else:
+        engine.load(G)
+    engine.update(increase_chance, danger_threshold)
+    engine.store(G)
+
+def simulate_risk(risk_sim_values, every_nth_frame, G, exits, connection, seed=None, flush_size=100):
     """
         Simulates risk propagation in a graph over multiple frames and stores the results in a database.
 
@@ -72,6 +52,9 @@ def simulate_risk(risk_sim_values, every_nth_frame, G, exits, connection, seed=N
             exits (list of str): List of exit-node identifiers.
             connection: Database connection for writing results.
             seed (int, optional): Seed for random number generator for reproducibility.
+            flush_size (int): Number of saved frames buffered before they are inserted. All the frames
+                              are written in a single transaction (see RiskWriter), so an error saving
+                              them stops the simulation and nothing is stored.
     """
     # Validate the input arguments
     if risk_sim_values.iterations <= 0:
@@ -82,41 +65,120 @@ def simulate_risk(risk_sim_values, every_nth_frame, G, exits, connection, seed=N
     if seed is not None:
         random.seed(seed)
 
-    for frame in range(risk_sim_values.iterations + 1):
-
-        for f, node_id, risk_val in risk_sim_values.risk_overrides:
-            if frame == f and node_id in G.nodes:
-                G.nodes[node_id]["risk"] = risk_val
-
-        if frame == 0:
-            # Apply starting risks
-            for node_id, risk_val in risk_sim_values.starting_risks:
-                if node_id in G.nodes:
-                    G.nodes[node_id]["risk"] = risk_val
-
-            # Ensure that exit nodes have risk 0
-            for exit_node in exits:
-                if exit_node in G.nodes:
-                    G.nodes[exit_node]["risk"] = 0
-            # Save the initial risk levels of all nodes before any updates
-            try:
-                write_risk_levels(connection, 0, {node: G.nodes[node]["risk"] for node in G.nodes})
-            except Exception as e:
-                print(f"Error writing initial risks: {e}")
-            continue
-
-        # directly use the iteration as frames
-        if frame % every_nth_frame == 0:
-            try:
-                # Update risks in the graph based on propagation and increase chances
-                update_risk(G,risk_sim_values.increase_chance, risk_sim_values.danger_threshold)
-
-                # Ensure that exit nodes retain a risk of 0 after the update
-                for exit_node in exits:
-                    if exit_node in G.nodes:
-                        G.nodes[exit_node]["risk"] = 0
-
-                # Save the updated risk levels for the current frame
-                write_risk_levels(connection, frame, {node: G.nodes[node]["risk"] for node in G.nodes})
-            except Exception as e:
-                print(f"Error updating risks at frame {frame}: {e}")
\ No newline at end of file
+    # The risks are kept in the array engine during the simulation and written back to G at the end
+    engine = RiskPropagation(G)
+    try:
+        with RiskWriter(connection, flush_size) as writer:
+            for frame in range(risk_sim_values.iterations + 1):
+
+                for f, node_id, risk_val in risk_sim_values.risk_overrides:
+                    if frame == f:
+                        engine.set_risk(node_id, risk_val)
+
+                if frame == 0:
+                    # Apply starting risks
+                    for node_id, risk_val in risk_sim_values.starting_risks:
+                        engine.set_risk(node_id, risk_val)
+
+                    # Ensure that exit nodes have risk 0
+                    for exit_node in exits:
+                        engine.set_risk(exit_node, 0)
+                    # Save the initial risk levels of all nodes before any updates
+                    writer.write(0, engine.risks_by_node())
+                    continue
+
+                # directly use the iteration as frames
+                if frame % every_nth_frame == 0:
+                    try:
+                        # Update risks based on propagation and increase chances
+                        engine.update(risk_sim_values.increase_chance, risk_sim_values.danger_threshold)
+
+                        # Ensure that exit nodes retain a risk of 0 after the update
+                        for exit_node in exits:
+                            engine.set_risk(exit_node, 0)
+                    except Exception as e:
+                        print(f"Error updating risks at frame {frame}: {e}")
+                        continue
+
+                    # Save the updated risk levels for the current frame. A failed flush loses every
+                    # buffered frame, so it is not skipped like a failed update
+                    writer.write(frame, engine.risks_by_node())
+    finally:
+        engine.store(G)
+
+
+def simulate_risk_batch(risk_sim_values, every_nth_frame, G, exits, connection, seeds, flush_size=100):
+    """
+        Simulates several independent risk realisations at once and stores them in a single table,
+        tagged by seed.
+
+        The realisations advance together as a seeds × nodes matrix (see RiskPropagation.update_batch),
+        each driven by its own numpy Generator seeded with its seed. Starting risks, overrides and exits
+        are applied to every realisation as in simulate_risk. A realisation can be copied into a regular
+        risk_data table with export_seed_risks.
+
+        Args:
+            risk_sim_values: The risk simulation parameters, as in simulate_risk.
+            every_nth_frame (int): How often (in frames) to save results.
+            G: NetworkX graph on which the simulation runs. Its node risks are the starting point and are
+               not modified.
+            exits (list of str): List of exit-node identifiers.
+            connection: Database connection for writing results, with a seeded_risk_data table
+                        (see create_seeded_risk_table).
+            seeds (list of int): Seed of each realisation.
+            flush_size (int): Number of saved frames buffered before they are inserted. As in simulate_risk,
+                              all the frames are written in a single transaction (see RiskWriter), so an
+                              error saving them stops the simulation and nothing is stored.
+    """
+    # Validate the input arguments
+    if risk_sim_values.iterations <= 0:
+        raise ValueError("iterations must be a positive integer.")
+    if every_nth_frame <= 0:
+        raise ValueError("every_nth_frame must be a positive integer.")
+    seeds = list(seeds)
+    if not seeds:
+        raise ValueError("seeds must not be empty.")
+
+    engine = RiskPropagation(G)
+    rngs = [np.random.default_rng(seed) for seed in seeds]
+    risks = np.tile(engine.risks, (len(seeds), 1))
+    exit_columns = [engine.index[exit_node] for exit_node in exits if exit_node in engine.index]
+
+    def set_column(node_id, risk_val):
+        column = engine.index.get(node_id)
+        if column is not None:
+            risks[:, column] = risk_val
+
+    with RiskWriter(connection, flush_size) as writer:
+        for frame in range(risk_sim_values.iterations + 1):
+
+            for f, node_id, risk_val in risk_sim_values.risk_overrides:
+                if frame == f:
+                    set_column(node_id, risk_val)
+
+            if frame == 0:
+                # Apply starting risks
+                for node_id, risk_val in risk_sim_values.starting_risks:
+                    set_column(node_id, risk_val)
+
+                # Ensure that exit nodes have risk 0
+                risks[:, exit_columns] = 0
+                # Save the initial risk levels of all nodes before any updates
+                writer.write_seeded(0, seeds, engine.ids, risks)
+                continue
+
+            # directly use the iteration as frames
+            if frame % every_nth_frame == 0:
+                try:
+                    # Update the risks of every realisation based on propagation and increase chances
+                    risks = engine.update_batch(risks, risk_sim_values.increase_chance,
+                                                risk_sim_values.danger_threshold, rngs)
+
+                    # Ensure that exit nodes retain a risk of 0 after the update
+                    risks[:, exit_columns] = 0
+                except Exception as e:
+                    print(f"Error updating risks at frame {frame}: {e}")
+                    continue
+
+                # Save the updated risk levels for the current frame, as in simulate_risk
+                writer.write_seeded(frame, seeds, engine.ids, risks)
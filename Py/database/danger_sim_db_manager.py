@@ -4,19 +4,37 @@ import random
 from collections import defaultdict
 import pandas as pd
 
-def create_risk_table(connection: sqlite3.Connection):
+# Storage modes of the risk_data table: every node at every saved frame, or only the changes
+RISK_STORAGES = ("full", "delta")
+# In delta mode, saved frames between two full snapshots of the risks
+DEFAULT_KEYFRAME_INTERVAL = 100
+
+def create_risk_table(connection: sqlite3.Connection, storage: str = "full", keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL):
     """
     Creates a table to store risk levels in the SQLite database.
 
+    In "delta" storage write_risk_levels only stores the risks that changed since the previous saved
+    frame, plus a full snapshot (keyframe) every `keyframe_interval` saved frames; the readers rebuild
+    the full state from the latest keyframe, so they return the same data in both modes. An area that
+    drops out of the risks of a frame is stored with a risk of 0 (a tombstone).
+
     Args:
         connection (sqlite3.Connection): Open SQLite database connection.
+        storage (str): "full" (a row per area and saved frame) or "delta" (a row per change).
+        keyframe_interval (int): Saved frames between two keyframes in delta storage.
 
     Raises:
         RuntimeError: If there is an error creating the table.
     """
+    if storage not in RISK_STORAGES:
+        raise ValueError(f"Unknown risk storage: {storage}")
+    if keyframe_interval <= 0:
+        raise ValueError("keyframe_interval must be a positive integer.")
     try:
         with connection:
             connection.execute("DROP TABLE IF EXISTS risk_data")
+            connection.execute("DROP TABLE IF EXISTS risk_frames")
+            connection.execute("DROP TABLE IF EXISTS risk_metadata")
             connection.execute(
                 """
                 CREATE TABLE risk_data (
@@ -27,14 +45,81 @@ def create_risk_table(connection: sqlite3.Connection):
                 )
                 """
             )
+            connection.execute("CREATE TABLE risk_metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            connection.executemany("INSERT INTO risk_metadata (key, value) VALUES (?, ?)",
+                                   [("storage", storage), ("keyframe_interval", str(keyframe_interval))])
+            if storage == "delta":
+                # Saved frames, also those without changes, and whether they hold a full snapshot
+                connection.execute("CREATE TABLE risk_frames (frame INTEGER PRIMARY KEY, keyframe INTEGER NOT NULL)")
     except sqlite3.Error as e:
         raise RuntimeError(f"Error creating risk_data table: {e}")
 
 
+def risk_storage(connection: sqlite3.Connection) -> tuple:
+    """
+    Returns the storage mode of the risk_data table.
+
+    Returns:
+        tuple: (storage, keyframe_interval). Tables created without metadata are "full".
+    """
+    has_metadata = connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'risk_metadata'").fetchone()
+    if has_metadata is None:
+        return "full", DEFAULT_KEYFRAME_INTERVAL
+    metadata = dict(connection.execute("SELECT key, value FROM risk_metadata"))
+    return metadata.get("storage", "full"), int(metadata.get("keyframe_interval", DEFAULT_KEYFRAME_INTERVAL))
+
+
+def _last_delta_state(connection: sqlite3.Connection):
+    """
+    Reads the state of the last saved frame of a delta-stored risk_data table.
+
+    Returns:
+        tuple or None: (frame, {area: risk_level}, saved frames since the keyframe), or None if no
+                       frame was saved yet.
+    """
+    frame, = connection.execute("SELECT MAX(frame) FROM risk_frames").fetchone()
+    if frame is None:
+        return None
+    keyframe, = connection.execute("SELECT MAX(frame) FROM risk_frames WHERE keyframe = 1").fetchone()
+    since, = connection.execute("SELECT COUNT(*) FROM risk_frames WHERE frame > ?", (keyframe,)).fetchone()
+    cursor = connection.execute(
+        "SELECT area, risk_level FROM risk_data WHERE frame BETWEEN ? AND ? ORDER BY frame, area", (keyframe, frame))
+    return frame, dict(cursor.fetchall()), since
+
+
+def _frame_rows(previous, frame: int, risks: dict, storage: str, keyframe_interval: int):
+    """
+    Returns the risk_data rows to store for a frame, its risk_frames row (None in full storage) and
+    the state to pass as `previous` for the next frame, in the format of _last_delta_state.
+    """
+    if storage == "full":
+        return [(frame, area, risk) for area, risk in risks.items()], None, None
+
+    keyframe = previous is None or frame <= previous[0] or previous[2] + 1 >= keyframe_interval
+    state = dict(risks)
+    if keyframe:
+        risk_data = [(frame, area, risk) for area, risk in risks.items()]
+    else:
+        last_risks = previous[1]
+        risk_data = [(frame, area, risk) for area, risk in risks.items() if last_risks.get(area) != risk]
+        # Areas that are no longer reported get a tombstone, so the readers do not keep their last risk
+        for area, risk in last_risks.items():
+            if area not in risks:
+                state[area] = 0.0
+                if risk != 0.0:
+                    risk_data.append((frame, area, 0.0))
+    return risk_data, (frame, int(keyframe)), (frame, state, 0 if keyframe else previous[2] + 1)
+
+
 def write_risk_levels(connection: sqlite3.Connection, frame: int, risks: dict):
     """
     Stores risk levels in the database for a specific frame.
 
+    In delta storage only the areas whose risk changed since the last saved frame of the table are
+    stored; the first frame, every keyframe_interval-th frame and any frame written out of order are
+    stored in full.
+
     Args:
         connection (sqlite3.Connection): Open SQLite database connection.
         frame (int): Frame number.
@@ -44,16 +129,328 @@ def write_risk_levels(connection: sqlite3.Connection, frame: int, risks: dict):
         RuntimeError: If there is an error saving the risk levels.
     """
     try:
+        storage, keyframe_interval = risk_storage(connection)
+        previous = _last_delta_state(connection) if storage == "delta" else None
+        risk_data, frame_row, _ = _frame_rows(previous, frame, risks, storage, keyframe_interval)
         with connection:
-            risk_data = [(frame, area, risk) for area, risk in risks.items()]
             connection.executemany(
                 "INSERT OR REPLACE INTO risk_data (frame, area, risk_level) VALUES (?, ?, ?)",
                 risk_data,
             )
+            if frame_row is not None:
+                connection.execute("INSERT OR REPLACE INTO risk_frames (frame, keyframe) VALUES (?, ?)", frame_row)
     except sqlite3.Error as e:
         raise RuntimeError(f"Error saving risk levels: {e}")
 
 
+class RiskWriter:
+    """
+    Buffered writer of risk levels for long simulations.
+
+    write_risk_levels commits (and syncs the file) once per frame. The writer instead keeps the frames
+    in memory and inserts them with one executemany per flush, all inside a single transaction that
+    is committed when the writer is closed, with the connection in WAL mode and synchronous=NORMAL.
+    The transaction is opened with an explicit BEGIN, so it also holds on connections in autocommit
+    mode (isolation_level=None).
+    Both settings are restored when the writer is closed. The rows written are the same as with
+    write_risk_levels, in full and delta storage, and as with write_seeded_risk_levels for the
+    realisations passed to write_seeded.
+
+    Usage:
+        with RiskWriter(connection, flush_size=200) as writer:
+            writer.write(frame, risks)
+
+    Attributes:
+        connection (sqlite3.Connection): Connection to the risk database.
+        flush_size (int): Number of buffered frames that triggers a flush.
+        frames_written (int): Number of frames received so far.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, flush_size: int = 100, *, wal: bool = True):
+        """
+        Initializes a RiskWriter and tunes the connection for bulk writes.
+
+        Parameters:
+            connection (sqlite3.Connection): Open SQLite database connection with a risk_data table,
+                                             without a pending transaction.
+            flush_size (int): Number of frames buffered before they are inserted.
+            wal (bool): Whether to switch the database to write-ahead logging while the writer is open.
+
+        Raises:
+            RuntimeError: If the connection has a pending transaction, which the writer would commit
+                          or roll back along with the risk levels.
+        """
+        if flush_size <= 0:
+            raise ValueError("flush_size must be a positive integer.")
+        if connection.in_transaction:
+            raise RuntimeError("The connection has a pending transaction; commit or roll it back before writing risks.")
+        self.connection = connection
+        self.flush_size = flush_size
+        self.frames_written = 0
+        self._storage = risk_storage(connection)
+        # Last state written in delta storage, continuing from the frames already in the table
+        self._delta_state = _last_delta_state(connection) if self._storage[0] == "delta" else None
+        self._buffered_rows = []
+        self._buffered_frame_rows = []
+        self._buffered_seeded_rows = []
+        self._buffered_frames = []
+        try:
+            self._journal_mode = connection.execute("PRAGMA journal_mode").fetchone()[0] if wal else None
+            if wal:
+                connection.execute("PRAGMA journal_mode=WAL")
+            self._synchronous = connection.execute("PRAGMA synchronous").fetchone()[0]
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # The journal mode cannot change inside a transaction, so it is opened last
+            connection.execute("BEGIN")
+        except sqlite3.Error as e:
+            raise RuntimeError(f"Error preparing the connection for bulk risk writes: {e}")
+
+    def write(self, frame: int, risks: dict):
+        """
+        Buffers the risk levels of a frame, flushing the buffer when it holds flush_size frames.
+        """
+        risk_data, frame_row, self._delta_state = _frame_rows(self._delta_state, frame, risks, *self._storage)
+        self._buffered_rows.extend(risk_data)
+        if frame_row is not None:
+            self._buffered_frame_rows.append(frame_row)
+        self._buffered_frames.append(frame)
+        self.frames_written += 1
+        if len(self._buffered_frames) >= self.flush_size:
+            self.flush()
+
+    def write_seeded(self, frame: int, seeds: list, areas: list, risks):
+        """
+        Buffers the risk levels of several realisations for a frame, for the seeded_risk_data table
+        (see write_seeded_risk_levels), flushing the buffer when it holds flush_size frames.
+        """
+        self._buffered_seeded_rows.extend(_seeded_rows(frame, seeds, areas, risks))
+        self._buffered_frames.append(frame)
+        self.frames_written += 1
+        if len(self._buffered_frames) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Inserts the buffered frames into the open transaction.
+
+        Raises:
+            RuntimeError: If there is an error inserting the risk levels. The buffered frames, named in
+                          the message, are lost.
+        """
+        try:
+            if self._buffered_rows:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO risk_data (frame, area, risk_level) VALUES (?, ?, ?)",
+                    self._buffered_rows,
+                )
+            if self._buffered_frame_rows:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO risk_frames (frame, keyframe) VALUES (?, ?)", self._buffered_frame_rows)
+            if self._buffered_seeded_rows:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO seeded_risk_data (seed, frame, area, risk_level) VALUES (?, ?, ?, ?)",
+                    self._buffered_seeded_rows,
+                )
+        except sqlite3.Error as e:
+            self._delta_state = None  # the next frame is stored in full
+            frames = self._buffered_frames
+            raise RuntimeError(f"Error saving the risk levels of frames {frames[0]} to {frames[-1]} "
+                               f"({len(frames)} frames): {e}")
+        finally:
+            self._buffered_rows = []
+            self._buffered_frame_rows = []
+            self._buffered_seeded_rows = []
+            self._buffered_frames = []
+
+    def close(self, commit: bool = True):
+        """
+        Flushes the remaining frames and ends the transaction, committing it (or rolling it back if
+        commit is False or the flush or commit fails), then restores the journal mode and synchronous
+        setting of the connection.
+        """
+        try:
+            if commit:
+                self.flush()
+                try:
+                    self.connection.execute("COMMIT")
+                except sqlite3.Error as e:
+                    raise RuntimeError(f"Error committing risk levels: {e}")
+        finally:
+            if self.connection.in_transaction:
+                # Not committed: nothing written by the writer is kept
+                self._delta_state = None
+                self.connection.execute("ROLLBACK")
+            self._buffered_rows = []
+            self._buffered_frame_rows = []
+            self._buffered_seeded_rows = []
+            self._buffered_frames = []
+            self.connection.execute(f"PRAGMA synchronous={int(self._synchronous)}")
+            if self._journal_mode is not None and not self.connection.in_transaction:
+                try:
+                    self.connection.execute(f"PRAGMA journal_mode={self._journal_mode}")
+                except sqlite3.OperationalError:
+                    pass  # other connections still have the database open; it stays in WAL mode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(commit=exc_type is None)
+        return False
+
+    def __repr__(self):
+        """
+        Returns a string representation of the RiskWriter instance, useful for debugging.
+        """
+        return f"RiskWriter(flush_size={self.flush_size}, frames_written={self.frames_written}, buffered={len(self._buffered_frames)})"
+
+
+def fetch_risk_frames(connection: sqlite3.Connection) -> list:
+    """
+    Returns the saved frames, in increasing order.
+    """
+    try:
+        if risk_storage(connection)[0] == "delta":
+            return [frame for frame, in connection.execute("SELECT frame FROM risk_frames ORDER BY frame")]
+        return [frame for frame, in connection.execute("SELECT DISTINCT frame FROM risk_data ORDER BY frame")]
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error fetching the risk frames: {e}")
+
+
+def fetch_risk_changes(connection: sqlite3.Connection) -> list:
+    """
+    Fetches the stored risk rows as they are: every row in full storage, only the keyframes and
+    changes in delta storage. Replaying them in order, keeping the last risk of each area, gives the
+    state of every saved frame.
+
+    Returns:
+        list of tuple: (frame, area, risk_level) tuples ordered by frame and area.
+    """
+    try:
+        return connection.execute("SELECT frame, area, risk_level FROM risk_data ORDER BY frame, area").fetchall()
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error fetching risk changes: {e}")
+
+
+def _expand_risks(connection: sqlite3.Connection):
+    """
+    Yields (frame, {area: risk_level}) for every saved frame of a delta-stored risk_data table,
+    rebuilding each full state from the keyframes and changes.
+    """
+    rows = fetch_risk_changes(connection)
+    state = {}
+    i = 0
+    for frame in fetch_risk_frames(connection):
+        while i < len(rows) and rows[i][0] <= frame:
+            _, area, risk_level = rows[i]
+            state[area] = risk_level
+            i += 1
+        yield frame, state
+
+
+def create_seeded_risk_table(connection: sqlite3.Connection):
+    """
+    Creates a table to store the risk levels of several risk realisations, tagged by seed.
+
+    Args:
+        connection (sqlite3.Connection): Open SQLite database connection.
+
+    Raises:
+        RuntimeError: If there is an error creating the table.
+    """
+    try:
+        with connection:
+            connection.execute("DROP TABLE IF EXISTS seeded_risk_data")
+            connection.execute(
+                """
+                CREATE TABLE seeded_risk_data (
+                    seed INTEGER NOT NULL,
+                    frame INTEGER NOT NULL,
+                    area TEXT NOT NULL,
+                    risk_level REAL NOT NULL,
+                    PRIMARY KEY (seed, frame, area)
+                ) WITHOUT ROWID
+                """
+            )
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error creating seeded_risk_data table: {e}")
+
+
+def _seeded_rows(frame: int, seeds: list, areas: list, risks):
+    """
+    Returns the seeded_risk_data rows of a frame, one per realisation and area.
+    """
+    return [(seed, frame, area, risk)
+            for seed, row in zip(seeds, risks.tolist())
+            for area, risk in zip(areas, row)]
+
+
+def write_seeded_risk_levels(connection: sqlite3.Connection, frame: int, seeds: list, areas: list, risks):
+    """
+    Stores the risk levels of several realisations for a specific frame.
+
+    Args:
+        connection (sqlite3.Connection): Open SQLite database connection.
+        frame (int): Frame number.
+        seeds (list): Seed of each realisation.
+        areas (list): Area of each column of `risks`.
+        risks: Risk levels of shape (len(seeds), len(areas)).
+
+    Raises:
+        RuntimeError: If there is an error saving the risk levels.
+    """
+    try:
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO seeded_risk_data (seed, frame, area, risk_level) VALUES (?, ?, ?, ?)",
+                _seeded_rows(frame, seeds, areas, risks),
+            )
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error saving seeded risk levels: {e}")
+
+
+def fetch_seed_risks(connection: sqlite3.Connection, seed: int) -> list:
+    """
+    Fetches the risk data of one realisation of the seeded_risk_data table.
+
+    Args:
+        connection (sqlite3.Connection): Open SQLite database connection.
+        seed (int): Seed of the realisation.
+
+    Returns:
+        list of tuple: (frame, area, risk_level) tuples, as fetch_all_risks returns them.
+
+    Raises:
+        RuntimeError: If there is an error fetching data.
+    """
+    try:
+        cursor = connection.execute(
+            "SELECT frame, area, risk_level FROM seeded_risk_data WHERE seed = ? ORDER BY frame, area", (seed,))
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error fetching risk data of seed {seed}: {e}")
+
+
+def export_seed_risks(connection: sqlite3.Connection, seed: int, target_connection: sqlite3.Connection):
+    """
+    Copies one realisation of the seeded_risk_data table into a fresh risk_data table, so it can be
+    used by the simulation like the output of simulate_risk.
+
+    Args:
+        connection (sqlite3.Connection): Connection holding the seeded_risk_data table.
+        seed (int): Seed of the realisation.
+        target_connection (sqlite3.Connection): Connection where the risk_data table is (re)created.
+    """
+    rows = fetch_seed_risks(connection, seed)
+    create_risk_table(target_connection)
+    try:
+        with target_connection:
+            target_connection.executemany(
+                "INSERT OR REPLACE INTO risk_data (frame, area, risk_level) VALUES (?, ?, ?)", rows)
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error exporting risk data of seed {seed}: {e}")
+
+
 def read_risk_data(connection: sqlite3.Connection) -> pd.DataFrame:
     """
     Reads all risk data stored in the database.
@@ -68,6 +465,8 @@ def read_risk_data(connection: sqlite3.Connection) -> pd.DataFrame:
         RuntimeError: If there is an error reading the data.
     """
     try:
+        if risk_storage(connection)[0] == "delta":
+            return pd.DataFrame(fetch_all_risks(connection), columns=["frame", "area", "risk_level"])
         query = "SELECT * FROM risk_data"
         return pd.read_sql_query(query, connection)
     except Exception as e:
@@ -83,12 +482,22 @@ def get_risk_levels_by_frame(connection: sqlite3.Connection, frame: int) -> dict
         frame (int): Frame number to query.
 
     Returns:
-        dict: {area: risk_level}
+        dict: {area: risk_level}, empty if the frame was not saved.
 
     Raises:
         RuntimeError: If there is an error fetching data.
     """
     try:
+        if risk_storage(connection)[0] == "delta":
+            if connection.execute("SELECT 1 FROM risk_frames WHERE frame = ?", (frame,)).fetchone() is None:
+                return {}
+            # Replay the changes since the latest keyframe at or before the frame
+            keyframe, = connection.execute(
+                "SELECT MAX(frame) FROM risk_frames WHERE keyframe = 1 AND frame <= ?", (frame,)).fetchone()
+            cursor = connection.execute(
+                "SELECT area, risk_level FROM risk_data WHERE frame BETWEEN ? AND ? ORDER BY frame, area",
+                (keyframe, frame))
+            return {area: risk_level for area, risk_level in cursor}
         cursor = connection.cursor()
         cursor.execute("SELECT area, risk_level FROM risk_data WHERE frame = ?", (frame,))
         rows = cursor.fetchall()
@@ -111,6 +520,8 @@ def get_risks_grouped_by_frame(connection: sqlite3.Connection) -> dict:
         RuntimeError: If there is an error fetching data.
     """
     try:
+        if risk_storage(connection)[0] == "delta":
+            return {frame: dict(sorted(state.items())) for frame, state in _expand_risks(connection)}
         query = "SELECT frame, area, risk_level FROM risk_data ORDER BY frame, area"
         cursor = connection.cursor()
         cursor.execute(query)
@@ -140,6 +551,10 @@ def fetch_all_risks(connection: sqlite3.Connection) -> list:
         RuntimeError: If there is an error fetching data.
     """
     try:
+        if risk_storage(connection)[0] == "delta":
+            return [(frame, area, risk_level)
+                    for frame, state in _expand_risks(connection)
+                    for area, risk_level in sorted(state.items())]
         query = "SELECT frame, area, risk_level FROM risk_data ORDER BY frame, area"
         cursor = connection.cursor()
         cursor.execute(query)
@@ -158,6 +573,9 @@ def get_high_risk_data(connection: sqlite3.Connection) -> pd.DataFrame:
         pd.DataFrame: DataFrame containing entries with high risk.
     """
     try:
+        if risk_storage(connection)[0] == "delta":
+            data = read_risk_data(connection)
+            return data[data["risk_level"] >= 1].reset_index(drop=True)
         query = "SELECT * FROM risk_data WHERE risk_level >= 1"
         return pd.read_sql_query(query, connection)
     except Exception as e:
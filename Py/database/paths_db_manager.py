@@ -1,21 +1,182 @@
 import sqlite3
+import sys
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
 import pandas as pd
 from typing import List
 import json
 
-def create_paths_table(connection: sqlite3.Connection):
+# Formats a path can be stored in: JSON text, or a little-endian uint16 BLOB of ids of path_node_ids
+PATH_FORMATS = ("json", "blob")
+MAX_BLOB_NODE_ID = 0xFFFF
+
+class PathCodec:
+    """
+    Encodes and decodes the paths of one paths database.
+
+    In the "blob" format each path is stored as a packed array of node ids, interned in the
+    path_node_ids table; in the "json" format as JSON text. decode accepts both, so a table can be
+    read transparently while (or after) it is migrated. Writes go through transaction(), so the ids
+    interned by a write only reach the in-memory dictionary once it commits.
+
+    Attributes:
+        connection (sqlite3.Connection): Connection to the paths database.
+        path_format (str): Format new paths are written in, one of PATH_FORMATS.
+        fingerprint (str): Fingerprint of the graph the connection reads and writes paths for, set by
+                           prepare_paths_table (None until then).
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        """
+        Initializes the codec of a connection, loading its format and node-id dictionary.
+        """
+        self.connection = connection
+        self.reload()
+
+    def reload(self):
+        """
+        Reloads the format, the node-id dictionary and the fingerprint of the connection from the database.
+        """
+        self.path_format = _read_metadata(self.connection, "path_format") or "json"
+        self.fingerprint = _read_session_fingerprint(self.connection)
+        self._ids = {}  # node (JSON) -> id
+        self._nodes = [None]  # id -> node; ids start at 1
+        self._pending = {}  # node (JSON) -> id interned by the transaction in progress
+        if _has_table(self.connection, "path_node_ids"):
+            for node_id, key in self.connection.execute("SELECT id, node FROM path_node_ids ORDER BY id"):
+                self._ids[key] = node_id
+                self._nodes.extend([None] * (node_id + 1 - len(self._nodes)))
+                self._nodes[node_id] = json.loads(key)
+
+    def encode(self, path: List[int], path_format: str = None):
+        """
+        Returns the stored representation of a path, in path_format or the format of the database.
+        """
+        if (path_format or self.path_format) == "json":
+            return json.dumps(path)
+        keys = [json.dumps(node) for node in path]
+        missing = [key for key in dict.fromkeys(keys) if key not in self._ids and key not in self._pending]
+        if missing:
+            # Check the id range before interning anything, new ids follow the largest one
+            last_id = self.connection.execute("SELECT COALESCE(MAX(id), 0) FROM path_node_ids").fetchone()[0]
+            if last_id + len(missing) > MAX_BLOB_NODE_ID:
+                raise RuntimeError(f"Too many nodes for the blob path format (more than {MAX_BLOB_NODE_ID})")
+            self.connection.executemany("INSERT OR IGNORE INTO path_node_ids (node) VALUES (?)", [(key,) for key in missing])
+            for key in missing:
+                self._pending[key] = self.connection.execute("SELECT id FROM path_node_ids WHERE node = ?", (key,)).fetchone()[0]
+        node_ids = array("H", [self._ids[key] if key in self._ids else self._pending[key] for key in keys])
+        if sys.byteorder == "big":
+            node_ids.byteswap()
+        return node_ids.tobytes()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs a write transaction on the connection. The node ids interned inside it are added to the
+        in-memory dictionary when it commits; if it fails the codec is reloaded from the database.
+        """
+        self._pending = {}
+        try:
+            with self.connection:
+                yield self
+        except BaseException:
+            self.reload()
+            raise
+        for key, node_id in self._pending.items():
+            self._ids[key] = node_id
+            self._nodes.extend([None] * (node_id + 1 - len(self._nodes)))
+            self._nodes[node_id] = json.loads(key)
+        self._pending = {}
+
+    def decode(self, value):
+        """
+        Returns the list of nodes of a stored path, whatever format it was stored in.
+        """
+        if not isinstance(value, bytes):
+            return json.loads(value)
+        node_ids = array("H")
+        node_ids.frombytes(value)
+        if sys.byteorder == "big":
+            node_ids.byteswap()
+        if node_ids and max(node_ids) >= len(self._nodes):
+            self.reload()  # nodes interned through another connection
+        nodes = self._nodes
+        return [nodes[node_id] for node_id in node_ids]
+
+    def __repr__(self):
+        """
+        Returns a string representation of the PathCodec instance, useful for debugging.
+        """
+        return f"PathCodec(path_format={self.path_format!r}, nodes={len(self._ids)})"
+
+# Codecs of the last connections used, so the node-id dictionary is loaded once per connection
+_codecs = OrderedDict()
+_MAX_CODECS = 8
+
+def path_codec(connection: sqlite3.Connection) -> PathCodec:
+    """
+    Returns the PathCodec of a connection, creating it the first time the connection is used.
+    """
+    entry = _codecs.get(id(connection))
+    if entry is None or entry.connection is not connection:
+        entry = PathCodec(connection)
+        _codecs[id(connection)] = entry
+        while len(_codecs) > _MAX_CODECS:
+            _codecs.popitem(last=False)
+    _codecs.move_to_end(id(connection))
+    return entry
+
+def _has_table(connection: sqlite3.Connection, name: str) -> bool:
+    return connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+def _has_column(connection: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in connection.execute(f"PRAGMA table_info({table})"))
+
+def _read_session_fingerprint(connection: sqlite3.Connection):
+    # The fingerprint is kept in a TEMP table, private to the connection
+    if connection.execute("SELECT name FROM sqlite_temp_master WHERE type = 'table' AND name = 'paths_session'").fetchone() is None:
+        return None
+    row = connection.execute("SELECT value FROM temp.paths_session WHERE key = 'fingerprint'").fetchone()
+    return row[0] if row is not None else None
+
+def _read_metadata(connection: sqlite3.Connection, key: str):
+    if not _has_table(connection, "paths_metadata"):
+        return None
+    row = connection.execute("SELECT value FROM paths_metadata WHERE key = ?", (key,)).fetchone()
+    return row[0] if row is not None else None
+
+def _decode_path_column(df: pd.DataFrame, connection: sqlite3.Connection) -> pd.DataFrame:
+    """
+    Converts the blob-encoded paths of a query result to JSON text, so DataFrames look the same
+    whatever the storage format.
+    """
+    if "path" in df and len(df) and any(isinstance(value, bytes) for value in df["path"]):
+        codec = path_codec(connection)
+        df["path"] = [json.dumps(codec.decode(value)) if isinstance(value, bytes) else value for value in df["path"]]
+    return df
+
+def create_paths_table(connection: sqlite3.Connection, path_format: str = "json"):
     """
     Creates a table to store the paths between nodes in the SQLite database.
 
     Args:
         connection (sqlite3.Connection): An open SQLite database connection.
+        path_format (str): Format the paths are stored in, "json" (text) or "blob" (packed node ids).
 
     Raises:
         RuntimeError: If there is an error creating the table.
     """
+    if path_format not in PATH_FORMATS:
+        raise ValueError(f"Unknown path format: {path_format}")
     try:
         with connection:
             connection.execute("DROP TABLE IF EXISTS paths")  # Elimina la tabla si ya existe
+            connection.execute("DROP TABLE IF EXISTS paths_metadata")
+            connection.execute("DROP TABLE IF EXISTS path_nodes")
+            connection.execute("DROP TABLE IF EXISTS path_node_ids")
             connection.execute(
                 """
                 CREATE TABLE paths (
@@ -23,15 +184,183 @@ def create_paths_table(connection: sqlite3.Connection):
                     source INTEGER NOT NULL,  -- Nodo de origen
                     target INTEGER NOT NULL,  -- Nodo de destino
                     cost INTEGER NOT NULL,    -- Costo del camino
-                    path TEXT NOT NULL,       -- Camino como cadena JSON
-                    betweenness REAL NOT NULL -- Betweenness centrality score
+                    path TEXT NOT NULL,       -- Camino como cadena JSON o BLOB de ids (ver PathCodec)
+                    betweenness REAL NOT NULL, -- Betweenness centrality score (log of the product, see centrality_measures)
+                    gamma REAL,               -- Tolerancia usada al enumerar (NULL si se enumeraron todos)
+                    fingerprint TEXT          -- Huella del grafo que generó el camino, ver prepare_paths_table
 )
                 """
             )
+            # Índice para recuperar todos los destinos de un origen en una sola consulta
+            connection.execute("CREATE INDEX idx_paths_source_target ON paths (source, target, gamma, fingerprint)")
+            # Datos de la tabla (p. ej. el formato de los caminos)
+            connection.execute("CREATE TABLE paths_metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            connection.execute("INSERT INTO paths_metadata (key, value) VALUES ('path_format', ?)", (path_format,))
+            # Diccionario de ids de nodo del formato blob
+            connection.execute("CREATE TABLE path_node_ids (id INTEGER PRIMARY KEY, node TEXT NOT NULL UNIQUE)")
+            create_path_nodes_table(connection)
     except sqlite3.Error as e:
         raise RuntimeError(f"Error creating paths table: {e}")
+    path_codec(connection).reload()
+
+def migrate_paths_format(connection: sqlite3.Connection, path_format: str):
+    """
+    Rewrites every stored path in another format, e.g. from JSON text to packed node ids.
+
+    Args:
+        connection (sqlite3.Connection): An open SQLite database connection.
+        path_format (str): The new format, "json" or "blob".
+
+    Raises:
+        RuntimeError: If there is an error rewriting the paths.
+    """
+    if path_format not in PATH_FORMATS:
+        raise ValueError(f"Unknown path format: {path_format}")
+    codec = path_codec(connection)
+    try:
+        with codec.transaction():
+            connection.execute("CREATE TABLE IF NOT EXISTS path_node_ids (id INTEGER PRIMARY KEY, node TEXT NOT NULL UNIQUE)")
+            connection.execute("CREATE TABLE IF NOT EXISTS paths_metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            rows = connection.execute("SELECT id, path FROM paths").fetchall()
+            connection.executemany("UPDATE paths SET path = ? WHERE id = ?",
+                                   [(codec.encode(codec.decode(path), path_format), path_id) for path_id, path in rows])
+            connection.execute("INSERT OR REPLACE INTO paths_metadata (key, value) VALUES ('path_format', ?)", (path_format,))
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error migrating the paths to the {path_format} format: {e}")
+    codec.reload()
+
+def create_path_nodes_table(connection: sqlite3.Connection):
+    """
+    Creates the inverted node -> path index of the paths table: one row per node of every stored path.
+
+    Args:
+        connection (sqlite3.Connection): An open SQLite database connection.
+    """
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS path_nodes (
+            path_id INTEGER NOT NULL,   -- id del camino en la tabla paths
+            node TEXT NOT NULL,         -- Nodo del camino (como cadena)
+            position INTEGER NOT NULL,  -- Posición del nodo en el camino
+            PRIMARY KEY (path_id, position)
+        )
+        """
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_path_nodes_node ON path_nodes (node)")
+
+def _index_path_nodes(connection: sqlite3.Connection, path_id: int, path: List[int]):
+    """
+    Adds the nodes of a stored path to the path_nodes index.
+    """
+    connection.executemany(
+        "INSERT INTO path_nodes (path_id, node, position) VALUES (?, ?, ?)",
+        [(path_id, str(node), position) for position, node in enumerate(path)]
+    )
+
+def rebuild_path_nodes(connection: sqlite3.Connection):
+    """
+    Rebuilds the path_nodes index from the paths stored in the paths table.
+
+    Args:
+        connection (sqlite3.Connection): An open SQLite database connection.
+
+    Raises:
+        RuntimeError: If there is an error rebuilding the index.
+    """
+    try:
+        with connection:
+            create_path_nodes_table(connection)
+            connection.execute("DELETE FROM path_nodes")
+            for path_id, path in connection.execute("SELECT id, path FROM paths").fetchall():
+                _index_path_nodes(connection, path_id, path_codec(connection).decode(path))
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error rebuilding the path_nodes index: {e}")
+
+def read_paths_fingerprint(connection: sqlite3.Connection):
+    """
+    Reads the fingerprint of the graph the connection was prepared for with prepare_paths_table.
+
+    Args:
+        connection (sqlite3.Connection): An open SQLite database connection.
 
-def insert_path(connection: sqlite3.Connection, source: int, target: int, cost: int, path: List[int], betweenness: float):
+    Returns:
+        str or None: The fingerprint the paths are read and written with, or None if the connection
+                     was not prepared (only the paths stored without a fingerprint are used then).
+    """
+    try:
+        return _read_session_fingerprint(connection)
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error reading the paths fingerprint: {e}")
+
+def _add_fingerprint_column(connection: sqlite3.Connection):
+    """
+    Adds the per-row fingerprint to a paths table that recorded a single one for the whole table,
+    tagging the stored paths with it.
+    """
+    connection.execute("ALTER TABLE paths ADD COLUMN fingerprint TEXT")
+    connection.execute("UPDATE paths SET fingerprint = (SELECT value FROM paths_metadata WHERE key = 'fingerprint')")
+    connection.execute("DELETE FROM paths_metadata WHERE key = 'fingerprint'")
+    connection.execute("DROP INDEX IF EXISTS idx_paths_source_target")
+    connection.execute("CREATE INDEX idx_paths_source_target ON paths (source, target, gamma, fingerprint)")
+
+def prepare_paths_table(connection: sqlite3.Connection, fingerprint: str, *, path_format: str = None) -> bool:
+    """
+    Makes the paths table ready for a graph: the paths are read and written keyed by its fingerprint.
+
+    Every stored path records the fingerprint of the graph and targets it was computed on, and the
+    connection only reads the paths of the given one, so paths computed before a layout, cost or
+    floor change in environment.py are never used, while the paths of other environments stay in
+    the store for when they are loaded again. Only the paths of unknown origin (stored without a
+    fingerprint) are deleted. The same database can therefore be reused across runs, machines and
+    environments.
+
+    Args:
+        connection (sqlite3.Connection): An open SQLite database connection.
+        fingerprint (str): Fingerprint of the graph and targets, see graph_fingerprint.
+        path_format (str, optional): Format to store the paths in ("json" or "blob"). Stored paths in
+                                     another format are migrated; None keeps the current format
+                                     ("json" for new tables).
+
+    Returns:
+        bool: True if paths of this fingerprint were already stored, False otherwise.
+
+    Raises:
+        RuntimeError: If there is an error reading or writing the database.
+    """
+    try:
+        has_paths = _has_table(connection, "paths")
+        # Tables that recorded a single fingerprint for all their paths are tagged with it below,
+        # and those from before any fingerprint was recorded are recreated
+        single_fingerprint = has_paths and not _has_column(connection, "paths", "fingerprint")
+        outdated = single_fingerprint and _read_metadata(connection, "fingerprint") is None
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error reading the paths table: {e}")
+    if not has_paths or outdated:
+        single_fingerprint = False
+        create_paths_table(connection, path_format or "json")
+    else:
+        if not _has_table(connection, "path_nodes"):
+            rebuild_path_nodes(connection)
+        if path_format is not None and path_codec(connection).path_format != path_format:
+            migrate_paths_format(connection, path_format)
+    try:
+        with connection:
+            if single_fingerprint:
+                _add_fingerprint_column(connection)
+            # Paths of unknown origin cannot be matched to any graph
+            connection.execute("DELETE FROM path_nodes WHERE path_id IN (SELECT id FROM paths WHERE fingerprint IS NULL)")
+            connection.execute("DELETE FROM paths WHERE fingerprint IS NULL")
+            connection.execute("CREATE TEMP TABLE IF NOT EXISTS paths_session (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            connection.execute("INSERT OR REPLACE INTO temp.paths_session (key, value) VALUES ('fingerprint', ?)",
+                               (fingerprint,))
+            kept = connection.execute("SELECT EXISTS (SELECT 1 FROM paths WHERE fingerprint = ?)", (fingerprint,)).fetchone()[0]
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error storing the paths fingerprint: {e}")
+    path_codec(connection).fingerprint = fingerprint
+    return bool(kept)
+
+def insert_path(connection: sqlite3.Connection, source: int, target: int, cost: int, path: List[int], betweenness: float,
+                gamma: float = None):
     """
     Insert or update a path between two nodes in the database, along with its betweenness centrality.
 
@@ -42,22 +371,108 @@ def insert_path(connection: sqlite3.Connection, source: int, target: int, cost:
         cost (int): The cost of the path.
         path (List[int]): A list of nodes representing the path between source and target.
         betweenness (float): The betweenness centrality score for the path.
+        gamma (float, optional): Cost tolerance used to bound the enumeration that produced the path.
+                                 None if every simple path was enumerated.
+
+    The path is stored with the fingerprint the connection was prepared for (see prepare_paths_table).
     """
     try:
-        with connection:
-            # Convert the path list to a JSON string
-            path_str = json.dumps(path)
-            connection.execute(
-                "INSERT OR REPLACE INTO paths (source, target, cost, path, betweenness) VALUES (?, ?, ?, ?, ?)",
-                (source, target, cost, path_str, betweenness)
+        codec = path_codec(connection)
+        with codec.transaction():
+            # Convert the path list to its stored representation (JSON string or BLOB)
+            path_str = codec.encode(path)
+            cursor = connection.execute(
+                "INSERT OR REPLACE INTO paths (source, target, cost, path, betweenness, gamma, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, target, cost, path_str, betweenness, gamma, codec.fingerprint)
             )
+            _index_path_nodes(connection, cursor.lastrowid, path)
     except sqlite3.Error as e:
         raise RuntimeError(f"Error inserting the path between {source} and {target}: {e}")
 
+def insert_paths(connection: sqlite3.Connection, rows):
+    """
+    Inserts several paths in a single transaction, with the fingerprint the connection was prepared for,
+    and indexes their nodes with one batched insert.
+
+    Args:
+        connection (sqlite3.Connection): An open SQLite database connection.
+        rows (iterable): Tuples (source, target, cost, path, betweenness, gamma), where `path`
+                         is a list of nodes and the rest of fields are as in insert_path.
+
+    Raises:
+        RuntimeError: If there is an error inserting the paths.
+    """
+    try:
+        rows = list(rows)
+        if not rows:
+            return
+        codec = path_codec(connection)
+        with codec.transaction():
+            cursor = connection.cursor()
+            # The id of each row is read back with lastrowid, which does not assume the ids are contiguous
+            path_ids = []
+            for source, target, cost, path, betweenness, gamma in rows:
+                cursor.execute(
+                    "INSERT OR REPLACE INTO paths (source, target, cost, path, betweenness, gamma, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (source, target, cost, codec.encode(path), betweenness, gamma, codec.fingerprint)
+                )
+                path_ids.append(cursor.lastrowid)
+            cursor.executemany(
+                "INSERT INTO path_nodes (path_id, node, position) VALUES (?, ?, ?)",
+                [(path_id, str(node), position)
+                 for path_id, (_, _, _, path, _, _) in zip(path_ids, rows)
+                 for position, node in enumerate(path)]
+            )
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error inserting paths: {e}")
+
+def read_paths_by_source(connection: sqlite3.Connection, source, targets, gamma: float) -> dict:
+    """
+    Reads, in a single indexed query, the paths stored from a source to any of the given targets
+    for the graph the connection was prepared for.
+
+    Args:
+        connection (sqlite3.Connection): An open SQLite database connection.
+        source: The source node.
+        targets (list): The target nodes.
+        gamma (float): Cost tolerance the paths were enumerated with.
+
+    Returns:
+        dict: {target: [(path, cost, betweenness), ...]} in insertion order. Targets without
+              stored paths are not included.
+    """
+    targets = list(targets)
+    if not targets:
+        return {}
+    try:
+        codec = path_codec(connection)
+        placeholders = ", ".join("?" for _ in targets)
+        cursor = connection.execute(
+            f"""
+            SELECT target, path, cost, betweenness
+            FROM paths
+            WHERE source = ? AND target IN ({placeholders}) AND gamma = ? AND fingerprint IS ?
+            ORDER BY id
+            """,
+            (source, *targets, gamma, codec.fingerprint)
+        )
+        # The column affinity may change the stored type of the node ids, so match them as strings
+        requested = {str(target): target for target in targets}
+        decode = codec.decode
+        paths = {}
+        for target, path, cost, betweenness in cursor:
+            paths.setdefault(requested[str(target)], []).append((decode(path), cost, betweenness))
+        return paths
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Error reading paths for source {source}: {e}")
+
 def find_paths_containing_node(connection: sqlite3.Connection, node: int):
     """
     Query paths that contain a specific node, excluding it from being source or target.
 
+    The lookup goes through the path_nodes index, so it matches whole node IDs and does not scan
+    the paths table. Only the paths of the graph the connection was prepared for are returned.
+
     Args:
         connection (sqlite3.Connection): An open SQLite database connection.
         node (int): The node that must be part of the path, but not the source or target.
@@ -67,15 +482,17 @@ def find_paths_containing_node(connection: sqlite3.Connection, node: int):
     """
     try:
         query = """
-        SELECT * 
-        FROM paths
-        WHERE path LIKE ? 
-        AND source != ? 
-        AND target != ?
+        SELECT DISTINCT paths.*
+        FROM path_nodes
+        JOIN paths ON paths.id = path_nodes.path_id
+        WHERE path_nodes.node = ?
+        AND paths.source != ?
+        AND paths.target != ?
+        AND paths.fingerprint IS ?
+        ORDER BY paths.id
         """
-        # Use the node's representation in the path as a string
-        path_pattern = f'%"{node}"%'  # Look for the node as part of the path
-        return pd.read_sql_query(query, connection, params=(path_pattern, node, node))
+        params = (str(node), node, node, path_codec(connection).fingerprint)
+        return _decode_path_column(pd.read_sql_query(query, connection, params=params), connection)
     except Exception as e:
         raise RuntimeError(f"Error finding paths that contain node {node}: {e}")
 
@@ -91,13 +508,14 @@ def read_all_paths(connection: sqlite3.Connection) -> pd.DataFrame:
     """
     try:
         query = "SELECT * FROM paths"
-        return pd.read_sql_query(query, connection)
+        return _decode_path_column(pd.read_sql_query(query, connection), connection)
     except Exception as e:
         raise RuntimeError(f"Error reading all paths: {e}")
 
 def read_paths_by_source_target(connection: sqlite3.Connection, source: int, target: int) -> pd.DataFrame:
     """
-    Reads the paths stored in the paths table for a specific source and target.
+    Reads the paths stored in the paths table for a specific source and target, for the graph the
+    connection was prepared for.
 
     Args:
         connection (sqlite3.Connection): An open SQLite database connection.
@@ -108,7 +526,8 @@ def read_paths_by_source_target(connection: sqlite3.Connection, source: int, tar
         pd.DataFrame: A DataFrame containing the paths between the source and target.
     """
     try:
-        query = "SELECT * FROM paths WHERE source = ? AND target = ?"
-        return pd.read_sql_query(query, connection, params=(source, target))
+        query = "SELECT * FROM paths WHERE source = ? AND target = ? AND fingerprint IS ?"
+        params = (source, target, path_codec(connection).fingerprint)
+        return _decode_path_column(pd.read_sql_query(query, connection, params=params), connection)
     except Exception as e:
         raise RuntimeError(f"Error reading paths for source {source} and target {target}: {e}")
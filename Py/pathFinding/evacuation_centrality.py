@@ -1,60 +1,230 @@
-import gurobipy as gp
-from gurobipy import GRB
-from pathAlgorithms import compute_efficient_paths
+try:
+    import gurobipy as gp
+    from gurobipy import GRB
+except ImportError:  # the ILP backend is optional, the max-flow backend has no extra dependencies
+    gp = None
+    GRB = None
+from Py.pathFinding.pathAlgorithms import collect_all_paths, compute_efficient_paths
 import math
 import networkx as nx
 
+# Auxiliary node joining all the targets in the max-flow network
+SUPER_SINK = ("__super_sink__",)
+# Maximum number of branch and bound nodes explored by exact_arc_disjoint_paths
+EXACT_SEARCH_LIMIT = 100000
 
-def evacuationCentralityAlgorithm(G, source, targets, gamma):
+
+def index_path_arcs(efficient_paths):
     """
-    Computes efficient evacuation paths from the source to targets (using the cost tolerance factor gamma)
-    and then computes the evacuation centrality (i.e. the maximum number of arc-disjoint paths) via gurobipy.
+    Maps each path to its list of arcs and builds the inverted index arc -> paths using it.
 
     Returns a tuple:
-       - efficient_paths: list of efficient paths (each path is a list of nodes)
-       - evacuation_centrality: optimal integer value of the maximum number of arc-disjoint paths
-       - best_paths: subset of efficient_paths selected by the model (those with x[p]=1)
-       - agile_scores: a dictionary mapping each efficient path to its agility value (geometric mean of intermediate nodes' centrality)
+       - path_arcs: list with the arcs (u, v) of each path
+       - arc_paths: dict mapping each arc to the indices of the paths that use it
     """
-    # Step 1: Obtain efficient paths (using your compute_efficient_paths function)
-    efficient_paths = compute_efficient_paths(G, source, targets, gamma, sort_paths=False)
-
-    if not efficient_paths:
-        return [], 0, [], {}
-
-    # Step 2: Build the set of arcs used in the efficient paths and map each path to its arc list.
     path_arcs = []
-    arcs_set = set()
-    for path in efficient_paths:
-        arc_list = []
-        for u, v in zip(path, path[1:]):
-            arc = (u, v)
-            arc_list.append(arc)
-            arcs_set.add(arc)
+    arc_paths = {}
+    for p_idx, path in enumerate(efficient_paths):
+        arc_list = list(zip(path, path[1:]))
         path_arcs.append(arc_list)
+        for arc in arc_list:
+            arc_paths.setdefault(arc, []).append(p_idx)
+    return path_arcs, arc_paths
+
+
+def decompose_unit_flow(flow, source, sink):
+    """
+    Decomposes an integral unit-capacity flow into source-sink paths, dropping any cycle found on the way.
+    """
+    remaining = {u: [v for v, f in arcs.items() for _ in range(int(round(f)))] for u, arcs in flow.items()}
+    paths = []
+    while remaining.get(source):
+        path = [source]
+        position = {source: 0}
+        node = source
+        while node != sink:
+            next_node = remaining[node].pop()
+            if next_node in position:
+                # Cancel the cycle and continue from its first node
+                for cycle_node in path[position[next_node] + 1:]:
+                    del position[cycle_node]
+                path = path[:position[next_node] + 1]
+            else:
+                position[next_node] = len(path)
+                path.append(next_node)
+            node = next_node
+        paths.append(path[:-1])  # remove the super sink
+    return paths
+
+
+def max_flow_arc_disjoint_paths(efficient_paths, path_arcs, arc_paths, source, targets):
+    """
+    Computes the maximum number of arc-disjoint efficient paths with a unit-capacity max-flow over
+    the union of the efficient arcs, and selects a set of arc-disjoint efficient paths.
+
+    The flow value is an upper bound of the number of arc-disjoint efficient paths. The selection starts
+    from the flow paths that are efficient paths and completes it greedily (paths sharing fewer arcs first),
+    using the inverted index to discard the paths that conflict with each selected one. When the flow paths
+    are all efficient the selection reaches the bound, which is then the optimum of the ILP. Otherwise the
+    greedy selection is only a lower bound, and exact_arc_disjoint_paths closes the gap within
+    EXACT_SEARCH_LIMIT explored nodes; past that limit the best selection found is returned, which may
+    be below the optimum.
+
+    Returns a tuple:
+       - evacuation_centrality: number of arc-disjoint efficient paths selected (optimal unless the search limit is hit)
+       - selected: indices of the selected paths in efficient_paths
+    """
+    network = nx.DiGraph()
+    network.add_edges_from(arc_paths, capacity=1)
+    for target in targets:
+        if target in network:
+            network.add_edge(target, SUPER_SINK)  # no capacity attribute: unbounded
+    if source not in network or SUPER_SINK not in network:
+        return 0, []
+
+    flow_value, flow = nx.maximum_flow(network, source, SUPER_SINK)
+
+    path_index = {tuple(path): p_idx for p_idx, path in enumerate(efficient_paths)}
+    flow_paths = [path_index.get(tuple(path)) for path in decompose_unit_flow(flow, source, SUPER_SINK)]
+    preferred = [p_idx for p_idx in flow_paths if p_idx is not None]
+
+    # Paths sharing fewer arcs with the rest are tried first
+    conflicts = [sum(len(arc_paths[arc]) - 1 for arc in arcs) for arcs in path_arcs]
+    order = preferred + sorted(range(len(efficient_paths)), key=lambda p_idx: conflicts[p_idx])
+
+    available = [True] * len(efficient_paths)
+    selected = []
+    for p_idx in order:
+        if not available[p_idx]:
+            continue
+        selected.append(p_idx)
+        for arc in path_arcs[p_idx]:
+            for other in arc_paths[arc]:
+                available[other] = False
+        if len(selected) == flow_value:
+            break
+
+    if len(selected) < flow_value:
+        selected = exact_arc_disjoint_paths(path_arcs, arc_paths, flow_value, selected)
+    return len(selected), sorted(selected)
+
+
+def exact_arc_disjoint_paths(path_arcs, arc_paths, upper_bound, initial, max_nodes=EXACT_SEARCH_LIMIT):
+    """
+    Finds a maximum set of arc-disjoint efficient paths by branch and bound, starting from a known
+    selection and stopping as soon as a selection reaches upper_bound (e.g. the max-flow value).
+
+    The search is exponential in the worst case, so it explores at most max_nodes nodes (None for no
+    limit). When the limit is hit the best selection found so far is returned: a valid set of
+    arc-disjoint paths, but not necessarily a maximum one.
+
+    Each node of the search either takes the first remaining candidate (discarding the paths sharing an
+    arc with it) or drops it. A branch is pruned when it cannot beat the best selection: it can add at most
+    one path per remaining candidate, and per distinct first and last arc among them, since those arcs
+    leave the source and enter the targets.
+
+    Returns:
+        list: Indices of the selected paths.
+    """
+    conflicts = [set() for _ in path_arcs]
+    for paths_using_arc in arc_paths.values():
+        for p_idx in paths_using_arc:
+            conflicts[p_idx].update(paths_using_arc)
+    first_arcs = [arcs[0] if arcs else p_idx for p_idx, arcs in enumerate(path_arcs)]
+    last_arcs = [arcs[-1] if arcs else p_idx for p_idx, arcs in enumerate(path_arcs)]
+
+    best = list(initial)
+    # Paths sharing fewer arcs are taken first, so good selections are found early
+    stack = [(sorted(range(len(path_arcs)), key=lambda p_idx: len(conflicts[p_idx])), [])]
+    explored = 0
+    while stack and len(best) < upper_bound:
+        if max_nodes is not None and explored >= max_nodes:
+            break
+        explored += 1
+        candidates, chosen = stack.pop()
+        if len(chosen) > len(best):
+            best = chosen
+        if not candidates:
+            continue
+        bound = len(chosen) + min(len(candidates), len({first_arcs[p_idx] for p_idx in candidates}),
+                                  len({last_arcs[p_idx] for p_idx in candidates}))
+        if bound <= len(best):
+            continue
+        p_idx = candidates[0]
+        stack.append((candidates[1:], chosen))
+        stack.append(([other for other in candidates[1:] if other not in conflicts[p_idx]], chosen + [p_idx]))
+    return best
+
+
+def ilp_arc_disjoint_paths(efficient_paths, arc_paths):
+    """
+    Computes the maximum number of arc-disjoint efficient paths by solving the binary model with gurobipy.
+
+    Returns a tuple:
+       - evacuation_centrality: optimal number of arc-disjoint paths (0 if the model is not optimal)
+       - selected: indices of the paths selected by the model (those with x[p]=1)
+    """
+    if gp is None:
+        raise RuntimeError("The 'gurobi' backend requires gurobipy to be installed.")
 
-    # Step 3: Define and solve the model in gurobipy.
     model = gp.Model("EvacuationCentrality")
     model.Params.OutputFlag = 0  # Suppress solver output
 
     # Binary decision variable x[p] for each path p.
     x = model.addVars(range(len(efficient_paths)), vtype=GRB.BINARY, name="x")
 
-    # Constraint: For each arc a in arcs_set, sum of x[p] for paths that use that arc must be <= 1.
-    for arc in arcs_set:
-        paths_using_arc = [p_idx for p_idx, arcs in enumerate(path_arcs) if arc in arcs]
-        if paths_using_arc:
-            model.addConstr(gp.quicksum(x[p_idx] for p_idx in paths_using_arc) <= 1, name=f"arc_{arc}")
+    # Constraint: For each arc, sum of x[p] for paths that use that arc must be <= 1.
+    for arc, paths_using_arc in arc_paths.items():
+        model.addConstr(gp.quicksum(x[p_idx] for p_idx in paths_using_arc) <= 1, name=f"arc_{arc}")
 
     # Objective: maximize the sum of x[p] (i.e., maximize the number of arc-disjoint paths).
     model.setObjective(gp.quicksum(x[p_idx] for p_idx in range(len(efficient_paths))), GRB.MAXIMIZE)
     model.optimize()
 
     if model.status != GRB.OPTIMAL:
-        return efficient_paths, 0, [], {}
+        return 0, []
+
+    selected = [p_idx for p_idx in range(len(efficient_paths)) if x[p_idx].X > 0.5]
+    return int(model.objVal), selected
+
+
+def evacuationCentralityAlgorithm(G, source, targets, gamma, *, backend=None):
+    """
+    Computes efficient evacuation paths from the source to targets (using the cost tolerance factor gamma)
+    and then computes the evacuation centrality (i.e. the maximum number of arc-disjoint paths), either
+    with a unit-capacity max-flow (backend="flow") or with the binary model solved by gurobipy (backend="gurobi").
+    By default gurobipy is used when it is installed, and the max-flow otherwise.
+
+    Returns a tuple:
+       - efficient_paths: list of efficient paths (each path is a list of nodes)
+       - evacuation_centrality: optimal integer value of the maximum number of arc-disjoint paths
+       - best_paths: efficient paths sorted by their agility score (best first)
+       - agile_scores: a dictionary mapping each efficient path to its agility value (geometric mean of intermediate nodes' centrality)
+       - disjoint_paths: the arc-disjoint efficient paths achieving evacuation_centrality
+    """
+    if backend is None:
+        backend = "flow" if gp is None else "gurobi"
+    if backend not in ("flow", "gurobi"):
+        raise ValueError(f"Unknown evacuation centrality backend: {backend}")
+
+    # Step 1: Obtain efficient paths
+    scored_paths = collect_all_paths(G, source, targets, gamma)
+    efficient_paths = [path for path, _, _ in compute_efficient_paths(scored_paths, gamma)] if scored_paths else []
+
+    if not efficient_paths:
+        return [], 0, [], {}, []
 
-    evacuation_centrality = int(model.objVal)
-    best_paths = [efficient_paths[p_idx] for p_idx in range(len(efficient_paths)) if x[p_idx].X > 0.5]
+    # Step 2: Map each path to its arc list and build the inverted index arc -> paths.
+    path_arcs, arc_paths = index_path_arcs(efficient_paths)
+
+    # Step 3: Compute the maximum number of arc-disjoint efficient paths.
+    if backend == "flow":
+        evacuation_centrality, selected = max_flow_arc_disjoint_paths(efficient_paths, path_arcs, arc_paths, source, targets)
+    else:
+        evacuation_centrality, selected = ilp_arc_disjoint_paths(efficient_paths, arc_paths)
+        if evacuation_centrality == 0:
+            return efficient_paths, 0, [], {}, []
+    disjoint_paths = [efficient_paths[p_idx] for p_idx in selected]
 
     # Step 4: Compute a new "agility" score for each efficient path.
     # Instead of using the sum of centrality values, we use the geometric mean of the intermediate nodes' centralities.
@@ -85,7 +255,7 @@ def evacuationCentralityAlgorithm(G, source, targets, gamma):
     scored_paths.sort(key=lambda x: x[1], reverse=True)
     best_agile_paths = [path for path, score in scored_paths]
 
-    return efficient_paths, evacuation_centrality, best_agile_paths, agile_scores
+    return efficient_paths, evacuation_centrality, best_agile_paths, agile_scores, disjoint_paths
 
 
 # Example usage:
@@ -123,7 +293,7 @@ if __name__ == "__main__":
     gamma = 0.3
 
     # Call the modified function that calculates evacuation centrality and agility scores
-    efficient_paths, evac_centrality, best_paths, agile_scores = evacuationCentralityAlgorithm(
+    efficient_paths, evac_centrality, best_paths, agile_scores, disjoint_paths = evacuationCentralityAlgorithm(
         G_complex, source, targets, gamma
     )
 
@@ -133,7 +303,11 @@ if __name__ == "__main__":
 
     print("\nEvacuation Centrality (max number of arc-disjoint paths):", evac_centrality)
 
-    print("\nBest Paths Selected by the ILP model:")
+    print("\nArc-disjoint Paths Selected by the model:")
+    for path in disjoint_paths:
+        print(path)
+
+    print("\nEfficient Paths Sorted by Agility Score:")
     for path in best_paths:
         print(path)
 
@@ -1,70 +1,420 @@
+import hashlib
+import heapq
+import weakref
+from itertools import chain
 import networkx as nx
+import numpy as np
+from scipy import sparse
 
-def centrality_measures(G, all_paths):
+def centrality_measures(G, all_paths, frequencies=None):
     """
     Compute global betweenness centrality (weighted by 'cost') for every node,
-    then score each path by multiplying the centralities of its interior nodes.
+    then score each path by the centralities of its interior nodes.
+
+    The score is the log of the product of the interior-node centralities, computed as a sum of
+    log-frequencies: it orders the paths exactly like the product but does not underflow to 0.0
+    on long paths. Paths without interior nodes score 0.0 (an empty product).
 
     Args:
         G (nx.DiGraph): Directed graph with a 'cost' attribute on each edge.
         all_paths (list of (path, cost)): Tuples where `path` is a list of nodes
                                           and `cost` is the path’s total cost.
+        frequencies (tuple, optional): (counts, number_of_paths) of a larger set of paths the centralities
+                                       are measured over, as returned by simple_path_frequencies. The
+                                       centralities are measured over all_paths when omitted.
 
     Returns:
         tuple:
             evacuation_betweenness (dict): Mapping node → betweenness value.
             scored_paths (list): Tuples (path, cost, score) where `score` is
-                                 the product of interior-node centralities.
+                                 the log of the product of interior-node centralities.
     """
     # 1) Compute global betweenness centrality over all node pairs
-    node_route_frequency = {node: 0.0 for node in G.nodes()}
-    sigma_st = len(all_paths)
+    node_index = {node: i for i, node in enumerate(G.nodes())}
+    number_of_paths = len(all_paths)
 
-    # Calculate betweenness centrality for each node (ignoring source and target nodes)
-    if sigma_st > 0:
-        for path, _ in all_paths:
-            for node in path[1:-1]:  # Exclude source and target nodes
-                node_route_frequency[node] += 1 / sigma_st
+    # Intern the interior nodes of every path (ignoring source and target nodes) into one flat array
+    interiors = [path[1:-1] for path, _ in all_paths]
+    lengths = np.fromiter(map(len, interiors), dtype=np.int64, count=number_of_paths)
+    interior = np.fromiter(map(node_index.__getitem__, chain.from_iterable(interiors)),
+                           dtype=np.int64, count=int(lengths.sum()))
+    if frequencies is None:
+        counts = np.bincount(interior, minlength=len(node_index))
+        sigma_st = number_of_paths
+    else:
+        node_counts, sigma_st = frequencies
+        counts = np.fromiter((node_counts.get(node, 0) for node in node_index), dtype=np.int64, count=len(node_index))
+    node_route_frequency = dict(zip(node_index, (counts / max(sigma_st, 1)).tolist()))
 
     # other option could be
     # evacuation_betweenness = nx.betweenness_centrality(G, weight='cost', normalized=True)
 
-    # 2) Score each path by multiplying the centralities of interior nodes
-    scored_paths = []
-    for path, cost in all_paths:
-        score = 1.0
-        # skip the first and last node (source and target)
-        for node in path[1:-1]:
-            score *= node_route_frequency.get(node, 0.0)
-        scored_paths.append((path, cost, score))
+    # 2) Score each path by summing the log-centralities of its interior nodes. The counts are sorted
+    # within each path first (a single sort of path * (sigma + 1) + count), so paths over the same
+    # nodes get exactly the same score whatever the order of the nodes.
+    scores = np.zeros(number_of_paths)
+    nonempty = lengths > 0
+    if nonempty.any():
+        keys = np.repeat(np.arange(number_of_paths, dtype=np.int64) * (sigma_st + 1), lengths) + counts[interior]
+        keys.sort()
+        log_frequency = np.log((keys % (sigma_st + 1)) / sigma_st)
+        starts = np.cumsum(lengths) - lengths
+        scores[nonempty] = np.add.reduceat(log_frequency, starts[nonempty])
+
+    scored_paths = [(path, cost, score) for (path, cost), score in zip(all_paths, scores.tolist())]
 
     return node_route_frequency, scored_paths
 
-def collect_all_paths(G: nx.DiGraph, source, targets):
+def combine_scores(first, second):
+    """
+    Adds two log-scores in log space, i.e. returns the log of the sum of their products. Used to
+    combine the betweenness of consecutive floor segments.
+    """
+    return float(np.logaddexp(first, second))
+
+# Slack used when pruning against the cost budget, so that float rounding in the
+# partial sums never discards a path that compute_efficient_paths would keep.
+COST_TOLERANCE = 1e-9
+
+def reverse_distances(G: nx.DiGraph, targets):
+    """
+    Runs a single reverse Dijkstra (over the 'cost' attribute) from all target nodes.
+
+    Args:
+        G (networkx.DiGraph): The directed graph with a 'cost' attribute on each edge.
+        targets (list): Target nodes the distances are measured to.
+
+    Returns:
+        dict: Mapping node -> cost of the cheapest path from that node to any target.
+              Nodes that cannot reach a target are not included.
+    """
+    sources = [target for target in targets if target in G]
+    if not sources:
+        return {}
+    return nx.multi_source_dijkstra_path_length(G.reverse(copy=False), sources, weight="cost")
+
+def bounded_simple_paths(G: nx.DiGraph, source, target, max_cost, lower_bound):
+    """
+    Enumerates the simple paths from source to target whose cost does not exceed max_cost.
+
+    The search is a depth-first traversal in adjacency order (the same order used by
+    nx.all_simple_paths), pruned with `lower_bound`, an admissible estimate of the
+    remaining cost from each node to the target.
+
+    Args:
+        G (networkx.DiGraph): The directed graph with a 'cost' attribute on each edge.
+        source (node): The node where the paths start.
+        target (node): The node where the paths end.
+        max_cost (float): Maximum allowed path cost.
+        lower_bound (dict): Mapping node -> lower bound of the cost to reach the target.
+                            Nodes missing from the mapping are considered unable to reach it.
+
+    Yields:
+        tuple: (path, cost) for every simple path within the cost budget.
+    """
+    if source == target:
+        yield [source], 0
+        return
+    if lower_bound.get(source, float("inf")) > max_cost + COST_TOLERANCE:
+        return
+
+    path = [source]
+    on_path = {source}
+    costs = [0]
+    stack = [iter(G.adj[source].items())]
+    while stack:
+        next_edge = next(stack[-1], None)
+        if next_edge is None:
+            # All the edges leaving the last node of the path have been explored.
+            stack.pop()
+            on_path.discard(path.pop())
+            costs.pop()
+            continue
+        child, data = next_edge
+        if child in on_path:
+            continue
+        child_cost = costs[-1] + data["cost"]
+        # Prune the branch if even the cheapest continuation exceeds the budget.
+        if child_cost + lower_bound.get(child, float("inf")) > max_cost + COST_TOLERANCE:
+            continue
+        if child == target:
+            yield path + [child], child_cost
+            continue
+        path.append(child)
+        on_path.add(child)
+        costs.append(child_cost)
+        stack.append(iter(G.adj[child].items()))
+
+def corridor_chains(G: nx.DiGraph, protected):
+    """
+    Finds the maximal chains of corridor nodes, i.e. nodes adjacent (in either direction) to exactly two
+    other nodes, such as the areas produced by split_and_format or split_vertically.
+
+    Args:
+        G (networkx.DiGraph): The directed graph.
+        protected (iterable): Nodes that must never be part of a chain (sources and targets).
+
+    Returns:
+        list: Tuples (a, chain, b), where `chain` lists the corridor nodes in order from endpoint a to endpoint b.
+    """
+    protected = set(protected)
+    neighbors = {}
+    for node in G.nodes:
+        if node in protected:
+            continue
+        adjacent = set(G.pred[node]) | set(G.succ[node])
+        if len(adjacent) == 2 and node not in adjacent:
+            neighbors[node] = tuple(adjacent)
+
+    chains = []
+    visited = set()
+    for node, (left, right) in neighbors.items():
+        if node in visited:
+            continue
+        visited.add(node)
+        halves = []
+        closed = False
+        for start in (left, right):
+            half = []
+            previous, current = node, start
+            while current in neighbors and current not in visited:
+                visited.add(current)
+                half.append(current)
+                first, second = neighbors[current]
+                previous, current = current, second if first == previous else first
+            if current == node:
+                closed = True  # the chain is a cycle without endpoints
+            halves.append((half, current))
+        if closed:
+            continue
+        (left_half, a), (right_half, b) = halves
+        chains.append((a, left_half[::-1] + [node] + right_half, b))
+    return chains
+
+def contract_corridors(G: nx.DiGraph, protected):
+    """
+    Collapses every corridor chain into super-edges between its endpoints, with the summed 'cost' and the
+    collapsed nodes stored in the 'corridor' edge attribute. Node attributes ('risk', 'is_stairs', 'floor')
+    are kept for the remaining nodes, and the adjacency order is preserved so that a depth-first search
+    visits the paths in the same order as on G.
+
+    A chain is left untouched when a super-edge would duplicate an existing edge, and it is dropped when
+    it cannot be traversed end to end (no simple path between the protected nodes can use it).
+
+    Args:
+        G (networkx.DiGraph): The directed graph with a 'cost' attribute on each edge.
+        protected (iterable): Nodes that must be kept (sources and targets).
+
+    Returns:
+        networkx.DiGraph: The reduced graph. Use expand_path to recover full node lists. The chain of every
+                          collapsed node is kept in R.graph["corridors"] as node -> (a, chain, b).
+    """
+    corridors = {}
+    entries = {}  # (endpoint, first corridor node) -> (other endpoint, corridor, cost)
+    joined = set()  # (endpoint, other endpoint) pairs already linked by a super-edge
+    for a, chain, b in corridor_chains(G, protected):
+        if a == b:
+            corridors.update(dict.fromkeys(chain, (a, chain, b)))  # a simple path cannot leave and come back to a
+            continue
+        super_edges = []
+        for u, corridor, v in ((a, chain, b), (b, chain[::-1], a)):
+            arcs = list(zip([u] + corridor, corridor + [v]))
+            if all(G.has_edge(x, y) for x, y in arcs):
+                super_edges.append((u, corridor, v, sum(G[x][y]["cost"] for x, y in arcs)))
+        if any(G.has_edge(u, v) or (u, v) in joined for u, _, v, _ in super_edges):
+            continue
+        for u, corridor, v, cost in super_edges:
+            entries[(u, corridor[0])] = (v, corridor, cost)
+            joined.add((u, v))
+        corridors.update(dict.fromkeys(chain, (a, chain, b)))
+
+    R = nx.DiGraph(corridors=corridors)
+    R.add_nodes_from((node, data) for node, data in G.nodes(data=True) if node not in corridors)
+    for u in R.nodes:
+        for v, data in G.adj[u].items():
+            if v not in corridors:
+                R.add_edge(u, v, **data)
+            elif (u, v) in entries:
+                end, corridor, cost = entries[(u, v)]
+                R.add_edge(u, end, cost=cost, corridor=corridor)
+    return R
+
+def reopen_corridor(G: nx.DiGraph, R: nx.DiGraph, node):
+    """
+    Returns a copy of the reduced graph R where the chain containing `node` is restored from G, so that a
+    search can start inside it. The super-edges of the chain are removed and the arcs entering the chain
+    from its endpoints are left out, since a simple path starting in the chain can never come back to it.
     """
-    Collects all simple paths from the source node to the target nodes, calculates the cost of each path,
+    a, chain, b = R.graph["corridors"][node]
+    H = R.copy()
+    H.graph["corridors"] = {other: corridor for other, corridor in R.graph["corridors"].items() if other not in chain}
+    for u, v in ((a, b), (b, a)):
+        if H.has_edge(u, v) and H[u][v].get("corridor") in (chain, chain[::-1]):
+            H.remove_edge(u, v)
+    H.add_nodes_from((other, G.nodes[other]) for other in chain)
+    for u in chain:
+        for v, data in G.adj[u].items():
+            H.add_edge(u, v, **data)
+    return H
+
+# Reduced graphs of the graphs seen by collect_all_paths, per set of targets
+_corridor_graphs = weakref.WeakKeyDictionary()
+
+def corridor_graph(G: nx.DiGraph, targets):
+    """
+    Returns contract_corridors(G, targets), building it only the first time the graph is seen with these
+    targets. Only the structure and costs of G are assumed to be fixed; node attributes are not used.
+    """
+    key = frozenset(targets)
+    reduced = _corridor_graphs.setdefault(G, {})
+    if key not in reduced:
+        reduced[key] = contract_corridors(G, key)
+    return reduced[key]
+
+def expand_path(R: nx.DiGraph, path):
+    """
+    Expands a path of a graph reduced with contract_corridors back to the full list of nodes.
+    """
+    full_path = [path[0]]
+    for u, v in zip(path, path[1:]):
+        full_path.extend(R[u][v].get("corridor", ()))
+        full_path.append(v)
+    return full_path
+
+# Interior-node counts of every simple path of the graphs seen by simple_path_frequencies
+_path_frequencies = weakref.WeakKeyDictionary()
+
+def simple_path_frequencies(G: nx.DiGraph, source, targets):
+    """
+    Counts, over every simple path from the source to the targets, how many paths go through each node
+    (source and target excluded). The paths are enumerated on the corridor-contracted graph and only the
+    counts are kept, once per graph, source and set of targets. The enumeration is exponential in the size
+    of the graph; it is only used by collect_all_paths(..., exhaustive_scores=True).
+
+    Returns:
+        tuple: (counts, number_of_paths), with counts a dict node -> number of paths through it.
+    """
+    key = (source, frozenset(targets))
+    cached = _path_frequencies.setdefault(G, {})
+    if key not in cached:
+        searchG = corridor_graph(G, targets)
+        if source not in searchG and source in searchG.graph["corridors"]:
+            searchG = reopen_corridor(G, searchG, source)
+        reachable = reverse_distances(searchG, targets)
+        counts = {}
+        number_of_paths = 0
+        for target in targets:
+            if target not in searchG:
+                continue
+            for path, _ in bounded_simple_paths(searchG, source, target, float("inf"), reachable):
+                number_of_paths += 1
+                for node in expand_path(searchG, path)[1:-1]:
+                    counts[node] = counts.get(node, 0) + 1
+        cached[key] = (counts, number_of_paths)
+    return cached[key]
+
+def collect_all_paths(G: nx.DiGraph, source, targets, gamma=None, *, blocked_nodes=None, contract=True, lower_bound=None,
+                      exhaustive_scores=False):
+    """
+    Collects the simple paths from the source node to the target nodes, calculates the cost of each path,
     and applies centrality measures to score them.
 
+    When gamma is given, only the paths whose cost is within (1 + gamma) times the cheapest path to any
+    of the targets are enumerated. The cheapest costs come from one reverse Dijkstra from the targets,
+    which is also used as lower bound to prune the depth-first search.
+
+    The centralities are measured over the enumerated paths, so with gamma they are relative to the paths
+    within the budget instead of every simple path: a node crossed by many expensive paths no longer raises
+    the score of the efficient paths through it, which changes the order of algorithm 1 (betweenness) with
+    respect to the exhaustive enumeration. exhaustive_scores=True restores the previous scores by counting
+    every simple path of G (without the blocked nodes removed) once per graph, source and targets with
+    simple_path_frequencies, at the exponential cost the bounded enumeration avoids.
+
     Args:
         G (networkx.DiGraph): The directed graph where nodes represent locations and edges have a 'cost' attribute.
         source (node): The source node from which paths start.
         targets (list): A list of target nodes to which paths are calculated.
+        gamma (float, optional): Tolerance factor for path cost. If None, every simple path is collected.
+        blocked_nodes (list, optional): Nodes that the paths must not traverse.
+        contract (bool): Whether to enumerate on the graph with its corridor chains contracted. The paths
+                         are expanded back to full node lists, so the result is the same.
+        lower_bound (mapping, optional): Cost from each node to the nearest target with the same blocked nodes,
+                                         e.g. an ExitDistanceTree kept up to date incrementally. Computed with
+                                         reverse_distances when omitted.
+        exhaustive_scores (bool): Whether to measure the centralities over every simple path of G instead of the
+                                  enumerated ones (exponential, see above).
 
     Returns:
         list: A list of paths with their associated costs and centrality scores.
     """
+    if blocked_nodes and source in blocked_nodes:
+        return []
+    costG = scoreG = G
+    if contract:
+        searchG = corridor_graph(G, targets)
+        if source not in searchG and source in searchG.graph["corridors"]:
+            searchG = reopen_corridor(G, searchG, source)
+        if blocked_nodes:
+            blocked_nodes = set(blocked_nodes)
+            blocked_edges = [(u, v) for u, v, corridor in searchG.edges(data="corridor")
+                             if corridor and not blocked_nodes.isdisjoint(corridor)]
+            searchG = nx.restricted_view(searchG, blocked_nodes, blocked_edges)
+    else:
+        searchG = nx.restricted_view(G, blocked_nodes, []) if blocked_nodes else G
+    if blocked_nodes:
+        G = nx.restricted_view(G, blocked_nodes, [])
+
+    if lower_bound is None:
+        lower_bound = reverse_distances(searchG, targets)
+    if source not in lower_bound:
+        return []
+    max_cost = float("inf") if gamma is None else (1 + gamma) * lower_bound[source]
+
     paths = []
-    # Collect all simple paths from source to each target node
+    # Collect the simple paths within the cost budget from source to each target node
     for target in targets:
-        for path in nx.all_simple_paths(G, source=source, target=target):
-            # Calculate the cost of each path
-            path_cost = sum(G[u][v]["cost"] for u, v in zip(path, path[1:]))
+        if target not in searchG:
+            continue
+        for path, path_cost in bounded_simple_paths(searchG, source, target, max_cost, lower_bound):
+            if contract:
+                path = expand_path(searchG, path)
+                path_cost = sum(costG[u][v]["cost"] for u, v in zip(path, path[1:]))
             paths.append((path, path_cost))
 
     # Calculate centrality measures and score the paths
-    _, paths = centrality_measures(G, paths)
+    enumerated_all = gamma is None and not blocked_nodes
+    frequencies = simple_path_frequencies(scoreG, source, targets) if exhaustive_scores and not enumerated_all else None
+    _, paths = centrality_measures(G, paths, frequencies)
     return paths
 
+def graph_fingerprint(G: nx.DiGraph, targets=None):
+    """
+    Computes a content hash of the graph structure used by the path enumeration.
+
+    Args:
+        G (networkx.DiGraph): Directed graph with a 'cost' attribute on each edge and, optionally,
+                              a 'floor' attribute on each node.
+        targets (list, optional): Exit nodes, hashed too when given.
+
+    Returns:
+        str: Hex digest over the nodes with their floors, the edges with their costs and the
+             targets. Two graphs with the same fingerprint produce the same candidate paths.
+    """
+    digest = hashlib.sha1()
+    for node in sorted(repr((node, data.get("floor"))) for node, data in G.nodes(data=True)):
+        digest.update(node.encode())
+        digest.update(b"\0")
+    digest.update(b"\1")
+    for edge in sorted(repr((u, v, data.get("cost"))) for u, v, data in G.edges(data=True)):
+        digest.update(edge.encode())
+        digest.update(b"\0")
+    if targets is not None:
+        digest.update(b"\1")
+        for target in sorted(map(repr, targets)):
+            digest.update(target.encode())
+            digest.update(b"\0")
+    return digest.hexdigest()
+
 def collect_unblocked_paths(paths, blocked_nodes):
     """
     Filters out paths that contain any of the blocked nodes, only if blocked_nodes is not empty.
@@ -112,3 +462,284 @@ def compute_efficient_paths(paths, gamma):
 
     # Return only the filtered efficient paths
     return efficient_paths
+
+def interior_incidence_matrix(paths, node_index):
+    """
+    Builds the sparse path × node incidence matrix of the interior nodes of each path
+    (the source and the target are excluded).
+
+    Args:
+        paths (list): Paths, each one a list of nodes.
+        node_index (dict): Mapping node -> column index.
+
+    Returns:
+        scipy.sparse.csr_matrix: Matrix of shape (len(paths), len(node_index)) with a 1.0 for every
+                                 interior node of every path.
+    """
+    lengths = np.fromiter((max(len(path) - 2, 0) for path in paths), dtype=np.int64, count=len(paths))
+    indptr = np.zeros(len(paths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.fromiter((node_index[node] for path in paths for node in path[1:-1]),
+                          dtype=np.int64, count=int(indptr[-1]))
+    data = np.ones(len(indices), dtype=float)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(paths), len(node_index)))
+
+def lowest_risk_path(paths, node_index, risk_vector):
+    """
+    Scores every path by the sum of the risks of its interior nodes with one sparse mat-vec and
+    returns the lowest-risk one. Ties are resolved in favour of the first path, as in a sequential scan.
+
+    Args:
+        paths (list): Candidate paths, each one a list of nodes.
+        node_index (dict): Mapping node -> position in risk_vector.
+        risk_vector (np.ndarray): Risk of every node for the current frame.
+
+    Returns:
+        tuple: (best_path, path_risks), with best_path None if there are no paths.
+    """
+    if not paths:
+        return None, np.zeros(0)
+    path_risks = interior_incidence_matrix(paths, node_index) @ risk_vector
+    return paths[int(np.argmin(path_risks))], path_risks
+
+def waypoint_heuristic(C, waypoints, targets):
+    """
+    Builds an A* heuristic from the waypoint centroids: the straight-line distance from each node to the
+    nearest target, scaled by the smallest cost per unit of length among the edges so that it never
+    overestimates the remaining cost (and stays consistent, since risk penalties are non-negative).
+
+    Args:
+        C (CompactGraph): Snapshot of the graph.
+        waypoints (dict): Mapping node -> ([x, y], radius), as in the environments.
+        targets (list): Target nodes.
+
+    Returns:
+        np.ndarray: Heuristic value of every node; zero for nodes without a waypoint, and zero everywhere
+                    if a target has no waypoint.
+    """
+    heuristic = np.zeros(len(C.ids))
+    if not waypoints or any(target not in waypoints for target in targets if target in C.index):
+        return heuristic
+    coords = np.array([waypoints[node][0] if node in waypoints else (np.nan, np.nan) for node in C.ids], dtype=float)
+    tails = np.repeat(np.arange(len(C.ids)), np.diff(C.succ_ptr))
+    lengths = np.hypot(*(coords[tails] - coords[C.succ_idx]).T)
+    measured = lengths > 0  # also drops the edges of nodes without a waypoint (nan)
+    if not measured.any():
+        return heuristic
+    scale = np.min(C.succ_cost[measured] / lengths[measured])
+    target_coords = coords[C.to_indices([target for target in targets if target in C.index])]
+    if len(target_coords) == 0:
+        return heuristic
+    distances = np.hypot(coords[:, None, 0] - target_coords[None, :, 0], coords[:, None, 1] - target_coords[None, :, 1])
+    heuristic = scale * distances.min(axis=1)
+    return np.nan_to_num(heuristic, nan=0.0)
+
+def risk_penalized_path(C, source, targets, risk_vector, risk_weight, *, blocked_nodes=None, heuristic=None):
+    """
+    Finds the path from the source to the nearest target minimizing the sum of `cost + risk_weight * risk`,
+    where the risk is the one of the node each edge enters, with a single A* search over the snapshot.
+
+    Args:
+        C (CompactGraph): Snapshot of the graph.
+        source (node): Node where the path starts.
+        targets (list): Target nodes.
+        risk_vector (np.ndarray): Risk of every node, ordered by C.index.
+        risk_weight (float): Cost units charged per unit of risk (λ).
+        blocked_nodes (list, optional): Nodes the path must not traverse. The source is never excluded.
+        heuristic (np.ndarray, optional): Admissible estimate of the remaining weight of every node, e.g.
+                                          from waypoint_heuristic. Plain Dijkstra is run without it.
+
+    Returns:
+        list or None: The path as a list of nodes, or None if no target can be reached.
+    """
+    if source not in C.index:
+        return None
+    n = len(C.ids)
+    start = C.index[source]
+    is_target = np.zeros(n, dtype=bool)
+    is_target[C.to_indices([target for target in targets if target in C.index])] = True
+    excluded = np.zeros(n, dtype=bool)
+    if blocked_nodes:
+        excluded[C.to_indices([node for node in set(blocked_nodes) if node in C.index])] = True
+    excluded[start] = False
+
+    penalty = (risk_weight * np.asarray(risk_vector, dtype=float)).tolist()
+    estimate = heuristic.tolist() if heuristic is not None else [0.0] * n
+    succ_ptr, succ_idx, succ_cost = C.succ_ptr.tolist(), C.succ_idx.tolist(), C.succ_cost.tolist()
+    excluded, is_target = excluded.tolist(), is_target.tolist()
+
+    distance = [float("inf")] * n
+    parent = [-1] * n
+    done = [False] * n
+    distance[start] = 0.0
+    heap = [(estimate[start], start)]
+    while heap:
+        _, u = heapq.heappop(heap)
+        if done[u]:
+            continue
+        done[u] = True
+        if is_target[u]:
+            path = [u]
+            while path[-1] != start:
+                path.append(parent[path[-1]])
+            return C.to_ids(reversed(path))
+        for k in range(succ_ptr[u], succ_ptr[u + 1]):
+            v = succ_idx[k]
+            if excluded[v] or done[v]:
+                continue
+            weight = distance[u] + succ_cost[k] + penalty[v]
+            if weight < distance[v]:
+                distance[v] = weight
+                parent[v] = u
+                heapq.heappush(heap, (weight + estimate[v], v))
+    return None
+
+def edge_travel_times(C, normal_max_speed, stairs_max_speed):
+    """
+    Returns the seconds needed to traverse each edge of the snapshot (in C.succ_idx order): its cost
+    divided by stairs_max_speed when it leaves a staircase node and by normal_max_speed otherwise,
+    as update_agent_speed_on_stairs sets the speed from the node the agent is in.
+    """
+    tails = np.repeat(np.arange(len(C.ids)), np.diff(C.succ_ptr))
+    speeds = np.where(C.is_stairs[tails], stairs_max_speed, normal_max_speed)
+    return C.succ_cost / speeds
+
+def time_dependent_path(C, source, targets, timeline, start_frame, edge_times, risk_weight, *,
+                        blocked_nodes=None, heuristic=None):
+    """
+    Finds the path from the source to the nearest target minimizing the sum of `cost + risk_weight * risk`,
+    where the risk of each node is the one it will have, according to the precomputed risk timeline,
+    at the frame the group is predicted to arrive there.
+
+    The search runs A* over the time-expanded graph whose states are (node, timeline row) pairs, so the
+    same node can be reached with different risks at different times; the best label is kept per state
+    and a path never visits a node twice.
+
+    Args:
+        C (CompactGraph): Snapshot of the graph.
+        source (node): Node where the path starts.
+        targets (list): Target nodes.
+        timeline (RiskTimeline): Risks of every node per stored frame, with its seconds_per_frame. Its columns
+                                 must follow C.index (see RiskTimeline.reindex).
+        start_frame (float): Frame at which the group is at the source.
+        edge_times (np.ndarray): Seconds to traverse each edge, from edge_travel_times.
+        risk_weight (float): Cost units charged per unit of risk (λ).
+        blocked_nodes (list, optional): Nodes the path must not traverse. The source is never excluded.
+        heuristic (np.ndarray, optional): Admissible estimate of the remaining cost of every node.
+
+    Returns:
+        list or None: The path as a list of nodes, or None if no target can be reached.
+    """
+    if timeline.node_index is not C.index and timeline.node_index != C.index:
+        raise ValueError("The risk timeline columns must follow the node order of the graph snapshot; use timeline.reindex(C.index).")
+    if source not in C.index:
+        return None
+    n = len(C.ids)
+    start = C.index[source]
+    is_target = np.zeros(n, dtype=bool)
+    is_target[C.to_indices([target for target in targets if target in C.index])] = True
+    excluded = np.zeros(n, dtype=bool)
+    if blocked_nodes:
+        excluded[C.to_indices([node for node in set(blocked_nodes) if node in C.index])] = True
+    excluded[start] = False
+
+    estimate = heuristic.tolist() if heuristic is not None else [0.0] * n
+    succ_ptr, succ_idx, succ_cost = C.succ_ptr.tolist(), C.succ_idx.tolist(), C.succ_cost.tolist()
+    times = np.asarray(edge_times, dtype=float).tolist()
+    excluded, is_target = excluded.tolist(), is_target.tolist()
+    risks = timeline.risks
+    frames_per_second = 1.0 / timeline.seconds_per_frame
+
+    # Labels: node, timeline row, elapsed seconds and parent label of every reached state
+    label_node, label_row, label_time, label_parent = [start], [timeline.row(start_frame)], [0.0], [-1]
+    best = {(start, label_row[0]): 0.0}
+    heap = [(estimate[start], 0.0, 0)]
+    while heap:
+        _, weight, label = heapq.heappop(heap)
+        u, row = label_node[label], label_row[label]
+        if weight > best[(u, row)]:
+            continue
+        if is_target[u]:
+            path = []
+            while label != -1:
+                path.append(label_node[label])
+                label = label_parent[label]
+            return C.to_ids(reversed(path))
+
+        on_path = set()
+        ancestor = label
+        while ancestor != -1:
+            on_path.add(label_node[ancestor])
+            ancestor = label_parent[ancestor]
+
+        for k in range(succ_ptr[u], succ_ptr[u + 1]):
+            v = succ_idx[k]
+            if excluded[v] or v in on_path:
+                continue
+            arrival = label_time[label] + times[k]
+            next_row = timeline.row(start_frame + arrival * frames_per_second)
+            next_weight = weight + succ_cost[k] + risk_weight * risks[next_row, v]
+            if next_weight < best.get((v, next_row), float("inf")):
+                best[(v, next_row)] = next_weight
+                label_node.append(v)
+                label_row.append(next_row)
+                label_time.append(arrival)
+                label_parent.append(label)
+                heapq.heappush(heap, (next_weight + estimate[v], next_weight, len(label_node) - 1))
+    return None
+
+def compose_floor_paths(first_segments, lower_segments, order=None):
+    """
+    Lazily joins the paths of a floor with the paths of the floor below that start where they end.
+
+    Every first segment, joined with the lower segments starting at its last node, forms a stream that
+    is already sorted (the lower segments are ranked once per entry node), so the complete paths come
+    out of a k-way heap merge of the streams in the same order as a stable sort of the full product,
+    and only the consumed paths are ever built.
+
+    Args:
+        first_segments (list): Tuples (path, cost, betweenness) of the upper floor.
+        lower_segments (dict): Mapping entry node -> list of (path, cost, betweenness) continuing from it.
+        order (str, optional): "cost" (ascending), "betweenness" (descending) or None to keep the order of
+                               the product (first segments, then lower segments).
+
+    Yields:
+        tuple: (path, cost, betweenness) of every complete path, where the costs of the two segments are
+               added and their betweenness log-scores combined with combine_scores.
+    """
+    if order is None:
+        for first_path, first_cost, first_betweenness in first_segments:
+            for second_path, second_cost, second_betweenness in lower_segments.get(first_path[-1], ()):
+                yield first_path + second_path[1:], first_cost + second_cost, combine_scores(first_betweenness, second_betweenness)
+        return
+    if order not in ("cost", "betweenness"):
+        raise ValueError(f"Unknown order: {order}")
+
+    def total_key(first, second):
+        if order == "cost":
+            return first[1] + second[1]
+        return -combine_scores(first[2], second[2])
+
+    ranked = {
+        node: sorted(range(len(segments)), key=lambda j: segments[j][1] if order == "cost" else -segments[j][2])
+        for node, segments in lower_segments.items()
+    }
+
+    def stream(i):
+        first = first_segments[i]
+        segments = lower_segments.get(first[0][-1], ())
+        # The totals are monotone along the ranking, so the segments whose totals tie (also after
+        # float rounding) are contiguous; they are emitted in product order, as a stable sort would.
+        run = []
+        for j in ranked.get(first[0][-1], ()):
+            key = total_key(first, segments[j])
+            if run and key != run[-1][0]:
+                yield from sorted(run)
+                run = []
+            run.append((key, i, j))
+        yield from sorted(run)
+
+    for _, i, j in heapq.merge(*(stream(i) for i in range(len(first_segments)))):
+        first_path, first_cost, first_betweenness = first_segments[i]
+        second_path, second_cost, second_betweenness = lower_segments[first_path[-1]][j]
+        yield first_path + second_path[1:], first_cost + second_cost, combine_scores(first_betweenness, second_betweenness)
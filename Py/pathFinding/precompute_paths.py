@@ -0,0 +1,174 @@
+"""
+Precomputes the candidate paths of an environment and bulk-loads them into the paths DB, so that
+simulations start with a warm path store instead of enumerating paths inside the timestep loop.
+
+Usage (from the repository root):
+    python -m Py.pathFinding.precompute_paths cruise_ship sqlite_data/Cruise_Ship_paths.db --gamma 0.2 0.3
+"""
+import argparse
+import importlib
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import networkx as nx
+
+from Py.classes.Environment_info import Environment_info
+from Py.database.paths_db_manager import PATH_FORMATS, create_paths_table, insert_paths, prepare_paths_table, \
+    read_paths_fingerprint
+from Py.pathFinding.pathAlgorithms import collect_all_paths, graph_fingerprint
+from Py.pathFinding.settingPaths import getTargetsForCurrentNode
+
+# Folder containing the `polygons` package with the environment definitions
+DEFAULT_ENVIRONMENTS_DIR = Path(__file__).resolve().parents[2] / "Notebooks" / "Main"
+
+# Floor graphs of the current worker process, set once by _init_worker
+_worker_graphs = {}
+
+
+def load_environment(name, environments_dir=DEFAULT_ENVIRONMENTS_DIR):
+    """
+    Loads an environment from polygons/environment.py by name (e.g. "cruise_ship" -> get_cruise_ship()).
+    """
+    if str(environments_dir) not in sys.path:
+        sys.path.insert(0, str(environments_dir))
+    environment_module = importlib.import_module("polygons.environment")
+    try:
+        factory = getattr(environment_module, f"get_{name}")
+    except AttributeError:
+        raise ValueError(f"Unknown environment: {name}")
+    return factory()
+
+
+def path_jobs(EnvInf, exits):
+    """
+    Lists the (floor, source, target) pairs the simulation can request, per floor.
+
+    Every node of a floor gets the targets chosen by getTargetsForCurrentNode, and the nodes connecting
+    each floor with the one above also get the targets of the lower floor, as getPosiblePaths does.
+    """
+    jobs = []
+    seen = set()
+
+    def add(floor, source, targets):
+        for target in targets:
+            if (floor, source, target) not in seen:
+                seen.add((floor, source, target))
+                jobs.append((floor, source, target))
+
+    floors = EnvInf.floors if EnvInf.floors is not None else {0: EnvInf.graph}
+    for floor, floorG in floors.items():
+        for node in floorG.nodes:
+            if EnvInf.graph.nodes[node]["floor"] != floor:
+                continue
+            try:
+                targets = getTargetsForCurrentNode(EnvInf, node, floor, exits)
+            except KeyError:
+                continue  # no lower floor to route to from this node
+            add(floor, node, [target for target in targets if target != node])
+
+    for floor in range(EnvInf.floor_number - 1):
+        sources = EnvInf.floor_connecting_nodes[(floor + 1, floor)]
+        targets = exits if floor == 0 else EnvInf.floor_connecting_nodes[(floor, floor - 1)]
+        for source in sources:
+            add(floor, source, targets)
+    return jobs
+
+
+def _init_worker(graphs):
+    global _worker_graphs
+    _worker_graphs = graphs
+
+
+def _enumerate_job(job):
+    """
+    Enumerates the candidate paths of one (floor, source, target, gamma) job in a worker process.
+    """
+    floor, source, target, gamma = job
+    paths = collect_all_paths(_worker_graphs[floor], source, [target], gamma)
+    return [(source, target, cost, path, betweenness, gamma) for path, cost, betweenness in paths]
+
+
+def stored_pairs(connection, gamma):
+    """
+    Returns the (source, target) pairs, as strings, that already have paths stored for gamma and
+    the graph the connection was prepared for.
+    """
+    cursor = connection.execute("SELECT DISTINCT source, target FROM paths WHERE gamma = ? AND fingerprint IS ?",
+                                (gamma, read_paths_fingerprint(connection)))
+    return {(str(source), str(target)) for source, target in cursor}
+
+
+def precompute_paths(EnvInf, exits, gammas, *, workers=None, skip_stored=True):
+    """
+    Enumerates the candidate paths of every (node, target) pair of the environment in parallel and
+    bulk-loads them into EnvInf.paths_connection.
+
+    Args:
+        EnvInf (Environment_info): Environment whose floors, connecting nodes and paths connection are used.
+        exits (list): Exit nodes of the environment.
+        gammas (list): Cost tolerances to precompute the paths for.
+        workers (int, optional): Number of worker processes (defaults to the number of CPUs).
+        skip_stored (bool): Whether to skip the pairs that already have paths stored.
+
+    Returns:
+        int: Number of paths inserted.
+    """
+    floors = EnvInf.floors if EnvInf.floors is not None else {0: EnvInf.graph}
+    # Plain copies of the floor graphs are cheaper to send to the workers than subgraph views
+    graphs = {floor: nx.DiGraph(floorG) for floor, floorG in floors.items()}
+
+    jobs = []
+    for gamma in gammas:
+        stored = stored_pairs(EnvInf.paths_connection, gamma) if skip_stored else set()
+        jobs.extend((floor, source, target, gamma) for floor, source, target in path_jobs(EnvInf, exits)
+                    if (str(source), str(target)) not in stored)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(graphs,)) as executor:
+        for job_rows in executor.map(_enumerate_job, jobs, chunksize=max(1, len(jobs) // 64)):
+            rows.extend(job_rows)
+
+    insert_paths(EnvInf.paths_connection, rows)
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute the candidate paths of an environment into a paths DB.")
+    parser.add_argument("environment", help="Environment name in polygons/environment.py, e.g. cruise_ship")
+    parser.add_argument("database", help="SQLite file where the paths are stored")
+    parser.add_argument("--targets", nargs="+", help="Exit nodes (defaults to the targets of the environment)")
+    parser.add_argument("--gamma", nargs="+", type=float, default=[0.4], help="Cost tolerance(s) used by the simulations")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--reset", action="store_true", help="Recreate the paths table before precomputing")
+    parser.add_argument("--path-format", choices=PATH_FORMATS, default=None,
+                        help="Store the paths as JSON text or packed node ids (migrates the stored paths)")
+    parser.add_argument("--environments-dir", default=DEFAULT_ENVIRONMENTS_DIR, help="Folder containing polygons/environment.py")
+    args = parser.parse_args(argv)
+
+    environment = load_environment(args.environment, args.environments_dir)
+    exits = args.targets or environment.targets
+
+    connection = sqlite3.connect(args.database)
+    try:
+        if args.reset:
+            create_paths_table(connection)
+        # Paths stored for a different layout, costs, floors or exits are kept apart by their fingerprint
+        if not prepare_paths_table(connection, graph_fingerprint(environment.graph, exits), path_format=args.path_format):
+            print(f"No paths stored for this environment in {args.database} yet")
+        EnvInf = Environment_info(environment.graph, connection, floor_number=environment.floor_number)
+        if environment.floor_number > 1:
+            EnvInf.floors = environment.floors
+            EnvInf.floor_connecting_nodes = environment.floor_connecting_nodes
+
+        start = time.perf_counter()
+        inserted = precompute_paths(EnvInf, exits, args.gamma, workers=args.workers)
+        print(f"Inserted {inserted} paths into {args.database} in {time.perf_counter() - start:.1f}s")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
+import hashlib
+
 from Py.pathFinding.pathAlgorithms import *
 from Py.database.paths_db_manager import *
+from Py.classes.lazyPaths import LazyPaths
+from Py.classes.pathSet import PathSet
 def update_graph_risks(G, risk_per_node):
     """
     Updates the risk values for each node in the graph based on the provided risk mapping.
@@ -107,63 +111,143 @@ def select_best_alternative_path(alternative_paths, neighbors_sorted, min_risk_n
     handle_blocked_node_in_path(best_path, agent_group)
 
     return best_path
-def getAlternativePathsForNode(current_node, targets, gamma, currentG, paths_connection, *, blocked_nodes=None):
-    """ Get alternative paths for a given node based on the specified algorithm and fetch from DB """
+def getCandidatePathsForNode(current_node, targets, gamma, currentG, paths_connection, *, path_cache=None):
+    """ Get the candidate paths (not filtered by blocked nodes nor cut by gamma) for a given node, fetching
+    them from the in-memory path cache (if given) or the DB, and enumerating the missing ones """
 
     # Convert dict_keys to a list if targets is a dict_keys object (do this only once before looping)
-    if blocked_nodes is None:
-        blocked_nodes = []
     if isinstance(targets, type({}.keys())):
         targets = list(targets)
 
-    all_paths = []
+    # Look in memory first and fetch the remaining targets from the DB with a single query
+    if path_cache is not None:
+        cached_paths, missing_targets = path_cache.get_many(currentG, current_node, targets, gamma)
+    else:
+        cached_paths, missing_targets = {}, targets
+    stored_paths = read_paths_by_source(paths_connection, current_node, missing_targets, gamma)
 
-    # Process each target individually
+    all_paths = []
+    new_rows = []
     for target in targets:
-        # Construct query to check if the path exists in the DB
-        query = """
-        SELECT * FROM paths
-        WHERE source = ? AND target = ?
-        """
-        params = [current_node, target]
-
-        # Fetch the paths from the database
-        paths_df = pd.read_sql_query(query, paths_connection, params=params)
-
-        # If paths are found in the database, add them to the result
-        if not paths_df.empty:
-            all_paths.extend([(json.loads(path), cost, betweenness) for path, cost, betweenness in zip(paths_df['path'], paths_df['cost'], paths_df['betweenness'])])
+        if target in cached_paths:
+            all_paths.extend(cached_paths[target])
+            continue
+        if target in stored_paths:
+            alternative_paths = stored_paths[target]
         else:
-            # If paths are not found in the DB, compute them using collect_all_paths
-            alternative_paths = collect_all_paths(currentG, current_node, [target])
+            # If paths are not found in the DB, enumerate the ones within the gamma budget
+            alternative_paths = collect_all_paths(currentG, current_node, [target], gamma)
+            new_rows.extend((current_node, target, cost, path, betweenness, gamma)
+                            for path, cost, betweenness in alternative_paths)
+        if path_cache is not None:
+            path_cache.put(currentG, current_node, target, gamma, alternative_paths)
+        all_paths.extend(alternative_paths)  # Add the paths to the list
+
+    # Insert the newly computed paths into the DB in one transaction
+    if new_rows:
+        insert_paths(paths_connection, new_rows)
+
+    # Index the candidates by node so that blocked-node filtering is vectorized
+    return PathSet(all_paths)
+
+
+def getDetourPaths(current_node, targets, gamma, currentG, blocked_nodes, *, path_cache=None, lower_bound=None):
+    """ Enumerate the paths of a node that avoid the blocked nodes, within the gamma budget of the cheapest one,
+    once per (node, targets, gamma, blocked nodes) when a PathCache is given. The lower bound (e.g. an
+    ExitDistanceTree set to these blocked nodes) is computed with one reverse Dijkstra when omitted """
+    key = ("detours", current_node, frozenset(targets), gamma, frozenset(blocked_nodes))
+    if path_cache is not None:
+        paths = path_cache.get_entry(currentG, key)
+        if paths is not None:
+            return paths
+    # One lower bound on the graph without the blocked nodes bounds the search towards every target,
+    # and the paths are enumerated and scored per target, like the stored ones
+    if lower_bound is None:
+        lower_bound = reverse_distances(nx.restricted_view(currentG, blocked_nodes, []), targets)
+    paths = []
+    for target in targets:
+        paths.extend(collect_all_paths(currentG, current_node, [target], gamma, blocked_nodes=blocked_nodes,
+                                       lower_bound=lower_bound))
+    if path_cache is not None:
+        path_cache.put_entry(currentG, key, paths)
+    return paths
 
-            # Insert the newly computed paths into the DB
-            for path, cost, betweenness in alternative_paths:
-                insert_path(paths_connection, current_node, target, cost, path, betweenness)
 
-            all_paths.extend(alternative_paths)  # Add the newly computed paths to the list
+def detourNeeded(candidates, unblocked, current_node, blocked_nodes, exit_distances=None):
+    """ Whether the blocked nodes raise the cheapest cost of the node, so the efficient detours may lie outside
+    the budget of the candidates. Only when the block touches every cheapest candidate, and an ExitDistanceTree
+    of the same graph is given, the tree is moved to the blocked nodes, which also tells when no detour exists """
+    if not blocked_nodes:
+        return False
+    # Cheap check first: while the block leaves one of the cheapest candidates open, the cheapest cost is unchanged
+    cheapest = candidates.costs <= candidates.costs.min() + COST_TOLERANCE
+    if unblocked[cheapest].any():
+        return False
+    if exit_distances is None:
+        return True
+    exit_distances.set_blocked(blocked_nodes)
+    detour_cost = exit_distances.distance_to_exit(current_node)
+    return np.isfinite(detour_cost) and detour_cost > candidates.costs.min() + COST_TOLERANCE
+
+
+def filterCandidatePaths(candidates, current_node, targets, gamma, currentG, *, blocked_nodes=None, path_cache=None,
+                         exit_distances=None):
+    """ Apply the blocked-node filter and the gamma cut to the candidate paths (a PathSet) of a node """
+    if isinstance(targets, type({}.keys())):
+        targets = list(targets)
 
     # Filter out paths with blocked nodes
-    paths_aux = collect_unblocked_paths(all_paths, blocked_nodes)
-    if paths_aux:
-      all_paths = paths_aux
+    unblocked = candidates.unblocked_mask(blocked_nodes)
+    if len(candidates.costs) and detourNeeded(candidates, unblocked, current_node, blocked_nodes, exit_distances):
+        # The stored paths are bounded by the unblocked optimum, so once every cheapest path is blocked
+        # the efficient detours may lie outside that budget: enumerate them on the unblocked graph.
+        paths_aux = getDetourPaths(current_node, targets, gamma, currentG, blocked_nodes, path_cache=path_cache,
+                                   lower_bound=exit_distances)
+        if paths_aux:
+            return compute_efficient_paths(paths_aux, gamma)
+    if not unblocked.any():
+        unblocked[:] = True
     # Compute efficient paths based on cost
-    efficient_paths = compute_efficient_paths(all_paths, gamma)
+    efficient_paths = candidates.efficient(gamma, unblocked)
 
     return efficient_paths
 
 
+def getAlternativePathsForNode(current_node, targets, gamma, currentG, paths_connection, *, blocked_nodes=None, path_cache=None):
+    """ Get alternative paths for a given node based on the specified algorithm and fetch from DB """
+    if isinstance(targets, type({}.keys())):
+        targets = list(targets)
+    all_paths = getCandidatePathsForNode(current_node, targets, gamma, currentG, paths_connection, path_cache=path_cache)
+    return filterCandidatePaths(all_paths, current_node, targets, gamma, currentG, blocked_nodes=blocked_nodes)
+
+
+def getFloorCandidatePaths(EnvInf, current_floor, node, targets, gamma):
+    """ Get the unfiltered candidate paths of a node, cached per (floor, node, gamma) in the bounded EnvInf.path_cache """
+    currentG = EnvInf.graph if EnvInf.floors == None else EnvInf.floors[current_floor]
+    key = ("candidates", current_floor, node, gamma)
+    candidates = EnvInf.path_cache.get_entry(currentG, key)
+    if candidates is None:
+        candidates = getCandidatePathsForNode(node, targets, gamma, currentG, EnvInf.paths_connection,
+                                              path_cache=EnvInf.path_cache)
+        EnvInf.path_cache.put_entry(currentG, key, candidates)
+    return candidates
+
+
+def getFloorPaths(EnvInf, current_floor, node, targets, gamma, *, blocked_nodes=None):
+    """ Get the efficient paths of a node for a given group, filtering the cached candidates on read """
+    currentG = EnvInf.graph if EnvInf.floors == None else EnvInf.floors[current_floor]
+    candidates = getFloorCandidatePaths(EnvInf, current_floor, node, targets, gamma)
+    return filterCandidatePaths(candidates, node, targets, gamma, currentG, blocked_nodes=blocked_nodes,
+                                path_cache=EnvInf.path_cache,
+                                exit_distances=EnvInf.exit_distances(targets, current_floor))
+
 
 def updateFloorPaths(EnvInf, current_floor, sources, targets, gamma, *, blocked_nodes=None):
-    """ Update floor paths for a given floor with the calculated paths """
-    if blocked_nodes is None:
-        blocked_nodes = []
+    """ Get the efficient paths of a floor for the given sources, keyed by source """
     all_next_floor_paths = {}
-    nextG = EnvInf.floors[current_floor]
     for source in sources:
-        alternative_paths = getAlternativePathsForNode(source, targets, gamma, nextG, EnvInf.paths_connection, blocked_nodes=blocked_nodes)
-        all_next_floor_paths[source] = alternative_paths
-    EnvInf.floor_paths[current_floor] = all_next_floor_paths
+        all_next_floor_paths[source] = getFloorPaths(EnvInf, current_floor, source, targets, gamma, blocked_nodes=blocked_nodes)
+    return all_next_floor_paths
 
 
 def getTargetsForCurrentNode(EnvInf, current_node, current_floor, exits):
@@ -179,54 +263,92 @@ def getTargetsForCurrentNode(EnvInf, current_node, current_floor, exits):
     return targets
 
 
-def getPosiblePaths(EnvInf, current_node, exits, gamma, algo, *, blocked_nodes=None):
+def blockedNodesOnCandidates(EnvInf, current_node, current_floor, exits, gamma, blocked_nodes):
+    """ Whether any blocked node lies on a candidate path of the node or of the floors below it. When none does,
+    the filtered paths are the same as without blocked nodes """
+    if not blocked_nodes:
+        return False
+    targets = getTargetsForCurrentNode(EnvInf, current_node, current_floor, exits)
+    candidate_sets = [getFloorCandidatePaths(EnvInf, current_floor, current_node, targets, gamma)]
+    for i in range(current_floor):
+        targets = exits if i == 0 else EnvInf.floor_connecting_nodes[(i, i-1)]
+        candidate_sets.extend(getFloorCandidatePaths(EnvInf, i, source, targets, gamma)
+                              for source in EnvInf.floor_connecting_nodes[(i+1, i)])
+    return any(node in candidates.node_index for candidates in candidate_sets for node in blocked_nodes)
+
+
+def getPosiblePaths(EnvInf, current_node, exits, gamma, algo, *, blocked_nodes=None, awareness=None):
     if blocked_nodes is None:
         blocked_nodes = []
     alternative_paths = []
     current_floor = EnvInf.graph.nodes[current_node]["floor"]
-
-    # Update paths for previous floors
+    # Inside a reroute batch, groups with the same node, algorithm and awareness share the result, unless
+    # their own blocked nodes lie on the candidate paths and change it
+    batch = EnvInf.posible_paths_batch
+    batch_key = (current_node, algo, awareness)
+    shared = batch is not None and not blockedNodesOnCandidates(EnvInf, current_node, current_floor, exits, gamma, blocked_nodes)
+    if shared and batch_key in batch:
+        return batch[batch_key]
+
+    # Get the paths of the previous floors, filtered for this group
+    lower_floor_paths = {}
     for i in range(current_floor):
-        if i not in EnvInf.floor_paths:
-            sources = EnvInf.floor_connecting_nodes[(i+1, i)]
-            targets = exits if i == 0 else EnvInf.floor_connecting_nodes[(i, i-1)]
-            updateFloorPaths(EnvInf, i, sources, targets, gamma, blocked_nodes=blocked_nodes)
-
-    # Get the paths for the current floor if not available
-    if current_floor not in EnvInf.floor_paths:
-        EnvInf.floor_paths[current_floor] = {}
-    if current_node not in EnvInf.floor_paths[current_floor]:
-        targets = getTargetsForCurrentNode(EnvInf, current_node, current_floor, exits)
-        currentG = EnvInf.graph if EnvInf.floors == None else EnvInf.floors[current_floor]
-        alternative_paths = getAlternativePathsForNode(current_node, targets, gamma, currentG, EnvInf.paths_connection, blocked_nodes=blocked_nodes)
-        EnvInf.floor_paths[current_floor][current_node] = alternative_paths
+        sources = EnvInf.floor_connecting_nodes[(i+1, i)]
+        targets = exits if i == 0 else EnvInf.floor_connecting_nodes[(i, i-1)]
+        lower_floor_paths[i] = updateFloorPaths(EnvInf, i, sources, targets, gamma, blocked_nodes=blocked_nodes)
+
+    # Get the paths for the current floor
+    targets = getTargetsForCurrentNode(EnvInf, current_node, current_floor, exits)
+    alternative_paths = getFloorPaths(EnvInf, current_floor, current_node, targets, gamma, blocked_nodes=blocked_nodes)
+
+    if current_floor == 0:
+        # Sort paths based on the algorithm
+        if algo == 0: # based on cost
+            alternative_paths.sort(key=lambda x: x[1])
+        elif algo == 1: # based on betweenness
+            alternative_paths.sort(key=lambda x: x[2], reverse=True)
+
+        # Return only the paths, without the costs
+        paths = [path for path, _, _ in alternative_paths]
     else:
-        alternative_paths = EnvInf.floor_paths[current_floor][current_node]
-
-    # Combine previous floor paths with the current floor paths
-    alternative_paths_aux = []
-    for i in range(current_floor):
-        for first_segment, first_cost, first_betweeness in alternative_paths:
-            for node, segments in EnvInf.floor_paths[i].items():
-                if first_segment[-1] == node:
-                    for second_segment, second_cost, second_betweeness in segments:
-                        complete_path = first_segment + second_segment[1:]
-                        complete_path_cost = first_cost + second_cost
-                        complete_path_betweeness = first_betweeness + second_betweeness
-                        alternative_paths_aux.append((complete_path, complete_path_cost, complete_path_betweeness))
-        alternative_paths = alternative_paths_aux
-
-    # Sort paths based on the algorithm
-    if algo == 0: # based on cost
-        alternative_paths.sort(key=lambda x: x[1])
-    elif algo == 1: # based on betweenness
-        alternative_paths.sort(key=lambda x: x[2], reverse=True)
-
-    # Return only the paths, without the costs
-    paths = [path for path, _, _ in alternative_paths]
+        order = {0: "cost", 1: "betweenness"}.get(algo)
+        # Chain the lower floors, from the lowest one up, into the paths from each entry node to an exit
+        lower_paths = lower_floor_paths[0]
+        for i in range(1, current_floor):
+            lower_paths = {source: list(compose_floor_paths(segments, lower_paths, order))
+                           for source, segments in lower_floor_paths[i].items()}
+        # Combine the current floor paths with them lazily, in the order of the algorithm, so only the
+        # complete paths that are actually looked at get built
+        paths = LazyPaths(path for path, _, _ in compose_floor_paths(alternative_paths, lower_paths, order))
+
+    if shared:
+        batch[batch_key] = paths
     return paths
 
 
+def getRiskPenalizedPath(EnvInf, current_node, exits, risk_vector, risk_weight, *, blocked_nodes=None):
+    """ Get the path minimizing cost + risk_weight * risk with one A* search (algorithm 2), without enumerating paths """
+    heuristic = EnvInf.exit_heuristic(exits)
+    best_path = risk_penalized_path(EnvInf.compact, current_node, exits, risk_vector, risk_weight,
+                                    blocked_nodes=blocked_nodes, heuristic=heuristic)
+    if best_path is None and blocked_nodes:
+        # As with the enumerated paths, fall back to the blocked ones when every route is blocked
+        best_path = risk_penalized_path(EnvInf.compact, current_node, exits, risk_vector, risk_weight, heuristic=heuristic)
+    return best_path
+
+
+def getForecastPath(EnvInf, current_node, exits, frame, risk_weight, *, blocked_nodes=None):
+    """ Get the path minimizing cost + risk_weight * risk at the predicted arrival frames (algorithm 3) """
+    heuristic = EnvInf.exit_heuristic(exits)
+    best_path = time_dependent_path(EnvInf.compact, current_node, exits, EnvInf.risk_timeline, frame,
+                                    EnvInf.edge_times(), risk_weight, blocked_nodes=blocked_nodes, heuristic=heuristic)
+    if best_path is None and blocked_nodes:
+        # As with the enumerated paths, fall back to the blocked ones when every route is blocked
+        best_path = time_dependent_path(EnvInf.compact, current_node, exits, EnvInf.risk_timeline, frame,
+                                        EnvInf.edge_times(), risk_weight, heuristic=heuristic)
+    return best_path
+
+
 def compute_low_awareness_alternative_path(exits, risk_per_node, next_node, current_node, agent_group, EnvInf, gamma, risk_threshold):
     """
     Computes an alternative path based on node risk values and the selected algorithm.
@@ -264,14 +386,12 @@ def compute_low_awareness_alternative_path(exits, risk_per_node, next_node, curr
         if risk_per_node[next_node] < risk_threshold:
             return None
 
-        # Update the graph with the risk values for each node.
-        update_graph_risks(G, risk_per_node)
+    # Read the risks of this frame directly, falling back to the graph for nodes without a value.
+    def node_risk(node):
+        return risk_per_node.get(node, G.nodes[node].get('risk', float('inf')))
 
     # Sort the neighbors of the current_node by their risk (lowest risk first).
-    neighbors_sorted = sorted(
-        G.neighbors(current_node),
-        key=lambda neighbor: G.nodes[neighbor].get('risk', float('inf'))
-    )
+    neighbors_sorted = sorted(G.neighbors(current_node), key=node_risk)
 
     # Block the riskier neighbouring nodes
     for neighbour in neighbors_sorted:
@@ -279,15 +399,24 @@ def compute_low_awareness_alternative_path(exits, risk_per_node, next_node, curr
             agent_group.blocked_nodes.append(neighbour)
 
     # Determine the minimum risk among the neighbors.
-    min_risk = G.nodes[neighbors_sorted[0]].get('risk', float('inf'))
+    min_risk = node_risk(neighbors_sorted[0])
     # Filter neighbors that have the same (lowest) risk or have a safe risk value.
-    min_risk_neighbors = [n for n in neighbors_sorted if G.nodes[n].get('risk', float('inf')) == min_risk or G.nodes[n].get('risk', float('inf')) < risk_threshold]
-
-    alternative_paths = getPosiblePaths(EnvInf, current_node, exits, gamma, algo, blocked_nodes=agent_group.blocked_nodes)
+    min_risk_neighbors = [n for n in neighbors_sorted if node_risk(n) == min_risk or node_risk(n) < risk_threshold]
+
+    if algo in (2, 3):
+        # Only the risks of the neighbouring nodes are known at this awareness level, not their forecast
+        known_risks = EnvInf.compact.node_values({n: risk_per_node[n] for n in neighbors_sorted})
+        best_path = getRiskPenalizedPath(EnvInf, current_node, exits, known_risks, agent_group.risk_weight,
+                                         blocked_nodes=agent_group.blocked_nodes)
+        handle_blocked_node_in_path(best_path, agent_group)
+        return best_path
+
+    alternative_paths = getPosiblePaths(EnvInf, current_node, exits, gamma, algo, blocked_nodes=agent_group.blocked_nodes,
+                                        awareness=agent_group.awareness_level)
     return select_best_alternative_path(alternative_paths, neighbors_sorted, min_risk_neighbors, agent_group)
 
 
-def compute_high_awareness_alternative_path(exits, risk_per_node, current_node, agent_group, EnvInf, gamma, risk_threshold):
+def compute_high_awareness_alternative_path(exits, risk_per_node, current_node, agent_group, EnvInf, gamma, risk_threshold, *, frame=None):
     """
     Computes an alternative path for a high-awareness agent group when the current path contains nodes
     with risk values at or above a given threshold. It evaluates the risk of the current path and, if necessary,
@@ -299,13 +428,16 @@ def compute_high_awareness_alternative_path(exits, risk_per_node, current_node,
         risk_per_node (dict): Mapping of nodes to their risk values.
         current_node: The node from which alternative paths are evaluated.
         agent_group (AgentGroup): An AgentGroup instance containing:
-            - algorithm (int): Identifier for the algorithm (e.g., 0 for efficient paths, 1 for centrality measures).
+            - algorithm (int): Identifier for the algorithm (e.g., 0 for efficient paths, 1 for centrality measures,
+                               2 for the risk-penalized shortest path, 3 for its forecast-aware variant).
             - path (list): The current path (list of nodes) followed by the agent group.
         EnvInf (Environment_info): An instance of the Environment_info class, which includes the graph and environment details.
                                    It provides access to the environment's graph and floor-specific data.
         gamma (float): Tolerance factor for path cost. Only paths with a total cost less than or equal to
                        (1 + gamma) * global_min_cost are considered efficient.
         risk_threshold (float): The risk threshold above which a node is considered dangerous.
+        frame (int, optional): Current frame, used by the forecast-aware algorithm (3) to look up the risks
+                               at the predicted arrival frames in EnvInf.risk_timeline.
 
     Returns:
         list or None: The best alternative path (as a list of nodes) with lower total risk, or None if
@@ -314,7 +446,6 @@ def compute_high_awareness_alternative_path(exits, risk_per_node, current_node,
     # Retrieve the algorithm identifier and current path from the agent group.
     algo = agent_group.algorithm
     current_path = agent_group.path
-    G = EnvInf.graph
     dangerous_path = False  # Flag to indicate if any node in the current path is dangerous.
     if current_path is not None:
         # Iterate over the nodes in the current path.
@@ -333,23 +464,21 @@ def compute_high_awareness_alternative_path(exits, risk_per_node, current_node,
         dangerous_path = True
 
     # If a dangerous node is found in the current path, attempt to compute an alternative path.
-    if dangerous_path:
-        # Update the graph with the current risk values for each node.
-        update_graph_risks(G, risk_per_node)
-
-
-        alternative_paths = getPosiblePaths(EnvInf, current_node, exits, gamma, algo, blocked_nodes=agent_group.blocked_nodes)
-
-        best_risk = float('inf')  # Initialize the best (lowest) risk value.
-
-        # Iterate over the computed alternative paths to find the one with the lowest total risk.
-        for path in alternative_paths:
-            # Calculate the total risk for intermediate nodes (exclude first and last nodes).
-            path_risk = sum(G.nodes[node]["risk"] for node in path[1:-1])
-            # If this path has a lower risk than the current best, update best_risk and best_path.
-            if path_risk < best_risk:
-                best_risk = path_risk
-                best_path = path
+    if dangerous_path and algo == 3 and EnvInf.risk_timeline is not None and frame is not None:
+        # Score every node with the risk it will have when the group gets there
+        best_path = getForecastPath(EnvInf, current_node, exits, frame, agent_group.risk_weight,
+                                    blocked_nodes=agent_group.blocked_nodes)
+    elif dangerous_path and algo in (2, 3):
+        # Weigh the risk of every node directly in the search instead of scoring enumerated paths
+        best_path = getRiskPenalizedPath(EnvInf, current_node, exits, EnvInf.risk_vector(risk_per_node, frame),
+                                         agent_group.risk_weight, blocked_nodes=agent_group.blocked_nodes)
+    elif dangerous_path:
+        alternative_paths = getPosiblePaths(EnvInf, current_node, exits, gamma, algo, blocked_nodes=agent_group.blocked_nodes,
+                                            awareness=agent_group.awareness_level)
+
+        # Score every path by the total risk of its intermediate nodes (excluding first and last nodes)
+        # with one sparse mat-vec against the risk vector of this frame, and keep the lowest-risk one.
+        best_path, _ = lowest_risk_path(alternative_paths, EnvInf.node_index, EnvInf.risk_vector(risk_per_node, frame))
     else:
         # If no dangerous node is found in the current path, no alternative path is needed.
         return None
@@ -358,8 +487,46 @@ def compute_high_awareness_alternative_path(exits, risk_per_node, current_node,
     return best_path
 
 
+def reroute_decision_key(exits, agent_group, EnvInf, current_node, next_node, risk_per_node, risk_threshold, gamma, frame):
+    """
+    Builds the key of a reroute decision from everything compute_alternative_path reads, with the risks
+    reduced to a signature of the relevant values: the next node and the neighbours of the current node
+    for low awareness, every node (plus the current path) for high awareness.
+    Returns None when the decision must not be cached.
+    """
+    algo = agent_group.algorithm
+    awareness = agent_group.awareness_level
+    current_path = agent_group.path
+    if risk_per_node is None:
+        return None
+    if awareness == 0:
+        neighbors = list(EnvInf.graph.neighbors(current_node)) if current_node in EnvInf.graph else []
+        risk_signature = tuple(risk_per_node.get(node) for node in [next_node, *neighbors])
+        path_signature = current_path is not None
+    elif awareness == 1:
+        risk_signature = hashlib.blake2b(EnvInf.risk_vector(risk_per_node, frame).tobytes(), digest_size=16).digest()
+        path_signature = None if current_path is None else tuple(current_path)
+    else:
+        return None
+    return (current_node, next_node, awareness, algo, frozenset(agent_group.blocked_nodes), risk_signature,
+            path_signature, tuple(exits), gamma, risk_threshold,
+            agent_group.risk_weight if algo in (2, 3) else None, frame if algo == 3 else None)
+
+
+def replay_reroute_decision(decision, agent_group):
+    """ Apply a cached reroute decision to the group: restore the nodes it blocked and its wait node """
+    best_path, added_blocked_nodes = decision
+    best_path = None if best_path is None else list(best_path)
+    for node in added_blocked_nodes:
+        if node not in agent_group.blocked_nodes:
+            agent_group.blocked_nodes.append(node)
+    if agent_group.awareness_level == 0:
+        handle_blocked_node_in_path(best_path, agent_group)
+    return best_path
+
+
 def compute_alternative_path(exits, agent_group, EnvInf, current_node=None, next_node=None, risk_per_node=None,
-                             risk_threshold=0.5, gamma=0.4):
+                             risk_threshold=0.5, gamma=0.4, *, frame=None):
     """
     Computes an alternative evacuation path for the agent group based on its awareness level and risk assessment.
 
@@ -379,6 +546,7 @@ def compute_alternative_path(exits, agent_group, EnvInf, current_node=None, next
         risk_threshold (float): The risk threshold value to consider when computing the alternative path.
         gamma (float): A weighting parameter that influences the alternative path computation by controlling the
                        trade-off between risk minimization and path optimality.
+        frame (int, optional): Current frame, needed by the forecast-aware algorithm (3).
 
     Returns:
         best_path: The computed best alternative path as a list of nodes, or None if no alternative path is computed.
@@ -390,6 +558,14 @@ def compute_alternative_path(exits, agent_group, EnvInf, current_node=None, next
     if wait_node is None or (agent_group.current_nodes and wait_node in agent_group.current_nodes.values()):
         agent_group.wait_until_node = None
 
+        # Reuse the decision taken with the same inputs, e.g. between two risk updates
+        key = reroute_decision_key(exits, agent_group, EnvInf, current_node, next_node, risk_per_node,
+                                   risk_threshold, gamma, frame) if EnvInf.reroute_cache is not None else None
+        decision = EnvInf.reroute_cache.get(key) if key is not None else None
+        if decision is not None:
+            return replay_reroute_decision(decision, agent_group)
+
+        blocked_before = len(agent_group.blocked_nodes)
         # Compute the alternative path based on the agent group's awareness level.
         if agent_group.awareness_level == 0:
             best_path = compute_low_awareness_alternative_path(
@@ -411,9 +587,12 @@ def compute_alternative_path(exits, agent_group, EnvInf, current_node=None, next
                 EnvInf,
                 gamma,
                 risk_threshold,
+                frame=frame,
             )
         else:
             best_path = None
+        if key is not None:
+            EnvInf.reroute_cache.put(key, best_path, agent_group.blocked_nodes[blocked_before:])
     else:
         best_path = None
 
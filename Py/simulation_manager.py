@@ -33,7 +33,7 @@ def try_get_node_index(node, path: list) -> int:
 
 
 def update_group_paths(sim_cfg, risk_map: dict, group: AgentGroup,
-                       env_info, threshold: float = 0.5) -> AgentGroup:
+                       env_info, threshold: float = 0.5, frame: int = None) -> AgentGroup:
     """
     Evaluates whether the group's path should be rerouted.
     If a better path is found, all agents follow the new path,
@@ -66,7 +66,7 @@ def update_group_paths(sim_cfg, risk_map: dict, group: AgentGroup,
         alt_path = compute_alternative_path(
             sim_cfg.get_exit_ids_keys(), group, env_info,
             curr_node, next_node,
-            risk_map, threshold, sim_cfg.gamma
+            risk_map, threshold, sim_cfg.gamma, frame=frame
         )
 
         if alt_path and not is_sublist(alt_path, current_path):
@@ -107,7 +107,7 @@ def record_group_path_data(gr_pth_conn, frame: int, group_id: int,
     Compute risk estimates and record dynamic path-choice data for a group at a given frame.
     """
     # Map numeric level to string
-    algorithm = 'Centrality' if group.algorithm == 1 else 'Efficient'
+    algorithm = {1: 'Centrality', 2: 'RiskPenalized', 3: 'Forecast'}.get(group.algorithm, 'Efficient')
     awareness = 'High' if group.awareness_level == 1 else 'Low'
     # Current area
     max_idx = -1
@@ -157,22 +157,57 @@ def record_group_path_data(gr_pth_conn, frame: int, group_id: int,
     )
 
 
+def leading_node(group: AgentGroup):
+    """
+    Return the current node of the group's leading agent (the one furthest along the path),
+    or None if it cannot be determined.
+    """
+    try:
+        return max((group.current_nodes[aid] for aid in group.agents), key=group.path.index)
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return None
+
+
+def bucket_groups(groups: dict) -> dict:
+    """
+    Bucket the group ids by (leading node, algorithm, awareness level), keeping their order.
+    """
+    buckets = {}
+    for group_id, group in groups.items():
+        key = (leading_node(group), group.algorithm, group.awareness_level)
+        buckets.setdefault(key, []).append(group_id)
+    return buckets
+
+
 def process_frame(sim_cfg, groups: dict, env_info, conn, area_conn, gr_pth_conn, frame: int, threshold: float):
     """
     Compute current nodes, log agent areas, adjust speeds, update paths for each group, and record path-choice data.
+    Groups standing on the same node with the same algorithm and awareness are rerouted as a batch that
+    shares their candidate paths; the rows are still written group by group, in the order of groups.
     """
-    # Retrieve risk map for this frame (area_id -> risk value)
-    risks = get_risk_levels_by_frame(conn, frame)
+    # Retrieve risk map for this frame (area_id -> risk value), from the precomputed timeline if there is one
+    if env_info.risk_timeline is not None:
+        risks = env_info.risk_timeline.risk_levels(frame)
+    else:
+        risks = get_risk_levels_by_frame(conn, frame)
 
     for group_id, group in groups.items():
         # Compute each agent's current node
         compute_current_nodes(sim_cfg, group, frame)
-        # Log agent areas
-        write_agent_area(area_conn, frame, group.agents, group.current_nodes, risks)
         # Update speeds on stairs if needed
         update_agent_speed_on_stairs(env_info.graph, sim_cfg, group)
-        # Potentially reroute group
-        group = update_group_paths(sim_cfg, risks, group, env_info, threshold)
+
+    updated = {}
+    for group_ids in bucket_groups(groups).values():
+        with env_info.path_batch():
+            for group_id in group_ids:
+                # Potentially reroute group
+                updated[group_id] = update_group_paths(sim_cfg, risks, groups[group_id], env_info, threshold, frame)
+
+    for group_id in groups:
+        group = updated[group_id]
+        # Log agent areas
+        write_agent_area(area_conn, frame, group.agents, group.current_nodes, risks)
         # Record path-choice data
         record_group_path_data(gr_pth_conn, frame, group_id, group, risks)
 